@@ -1,7 +1,19 @@
+import codecs
+import concurrent.futures
+import hashlib
+import json
+import os
+import pathlib
+import re
+import threading
+import time
 import warnings
 
+import numpy
 import pandas
 import requests
+import requests.adapters
+import us
 
 from cpe_help import util
 
@@ -20,7 +32,28 @@ class ACS(object):
     Note that only the 5 year estimates will be available through this
     class.
     """
-    def __init__(self, year=None, key=None):
+
+    @property
+    def path(self):
+        return util.path.DATA_DIR / 'acs' / f'{self.year}'
+
+    @property
+    def directories(self):
+        return [
+            self.path,
+            self.path / 'TRACT',
+            self.path / 'BG',
+        ]
+
+    def tract_values_path(self, state):
+        return self.path / 'TRACT' / f'{state}.pkl'
+
+    def bg_values_path(self, state):
+        return self.path / 'BG' / f'{state}.pkl'
+
+    def __init__(self, year=None, key=None, max_workers=None,
+                 cache_dir=None, cache_size=None, max_retries=None,
+                 rate=None, base_url=None, timeout=None):
         """
         Initialize a new ACS object
 
@@ -34,23 +67,133 @@ class ACS(object):
         key : None or str, default None
             A key used to make requests for the data. If None, use the
             key specified in the configuration file.
+        max_workers : None or int, default None
+            Maximum number of requests to the API that may be running
+            at the same time. If None, use the limit specified in the
+            configuration file.
+        cache_dir : None, str or pathlib.Path, default None
+            Where responses from the API are cached. If None, use
+            data/acs/cache.
+        cache_size : None or int, default None
+            Maximum size of the cache, in megabytes. When exceeded, the
+            least recently used responses are removed. If 0, do not use
+            a cache. If None, use the size specified in the
+            configuration file.
+        max_retries : None or int, default None
+            How many times a query is retried after a transient failure
+            (e.g. 429 Too Many Requests or 503 Service Unavailable),
+            waiting exponentially longer between retries. If None, use
+            the number specified in the configuration file.
+        rate : None or float, default None
+            Maximum average number of requests per second. If 0, do
+            not limit the rate. If None, use the rate specified in the
+            configuration file.
+        base_url : None or str, default None
+            Where the Census API is, e.g. 'https://api.census.gov/data'
+            (or a local stand-in server, see cpe_help.mock_census). If
+            None, use the URL specified in the configuration file.
+        timeout : None or float, default None
+            Seconds to wait for the API (to connect, or to send more
+            data) before giving up and retrying. If None, use the
+            timeout specified in the configuration file.
         """
         # retrieve default values from configuration
-        if year is None or key is None:
-            config = util.get_configuration()
-            if year is None:
-                year = config['Census'].getint('Year')
-            if key is None:
-                key = config['Census']['Key']
+        config = util.get_configuration()['Census']
+        if year is None:
+            year = config.getint('Year')
+        if key is None:
+            key = config['Key']
+        if max_workers is None:
+            max_workers = config.getint('MaxConcurrentRequests')
+        if cache_dir is None:
+            cache_dir = util.path.DATA_DIR / 'acs' / 'cache'
+        if cache_size is None:
+            cache_size = config.getint('CacheSize')
+        if max_retries is None:
+            max_retries = config.getint('MaxRetries')
+        if rate is None:
+            rate = config.getfloat('RequestsPerSecond')
+        if base_url is None:
+            base_url = config['BaseURL']
+        if timeout is None:
+            timeout = config.getfloat('Timeout')
+
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if cache_size < 0:
+            raise ValueError("cache_size cannot be negative")
+        if max_retries < 0:
+            raise ValueError("max_retries cannot be negative")
+        if rate < 0:
+            raise ValueError("rate cannot be negative")
+        if timeout <= 0:
+            raise ValueError("timeout must be positive")
 
         self.year = year
         self.key = key
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = _get_session(max_workers)
+        self.rate_limiter = None
+        if rate > 0:
+            self.rate_limiter = _TokenBucket(rate, capacity=max_workers)
+        self.cache = None
+        if cache_size > 0:
+            self.cache = _ResponseCache(cache_dir, cache_size * 2 ** 20)
 
     def __repr__(self):
         """
         Represent the ACS object
         """
-        return f"ACS(year={self.year!r}, key={self.key!r})"
+        return (f"ACS(year={self.year!r}, key={self.key!r},"
+                f" max_workers={self.max_workers!r})")
+
+    # doit actions
+
+    def create_directories(self):
+        """
+        Create the directories where files will be saved
+        """
+        for dir in self.directories:
+            util.file.maybe_mkdir(dir)
+
+    def download_values(self, state):
+        """
+        Download the configured variables for all tracts and block
+        groups in a state
+
+        Both geographies are fetched in a single planned batch.
+
+        Parameters
+        ----------
+        state : str
+            GEOID for the wanted state.
+        """
+        # the API only returns block groups inside a county
+        counties = self.data(['NAME'], geography='county',
+                             inside=f'state:{state}')
+        counties = sorted(counties['county'])
+
+        variables = _configured_variables()
+        tracts, bgs = self.data_batch([
+            (variables, 'tract', [f'state:{state}']),
+            (variables, 'block group', [f'state:{state} county:{county}'
+                                        for county in counties]),
+        ])
+        tracts.to_pickle(self.tract_values_path(state))
+        bgs.to_pickle(self.bg_values_path(state))
+
+    # input/output
+
+    def load_tract_values(self, state):
+        return pandas.read_pickle(self.tract_values_path(state))
+
+    def load_bg_values(self, state):
+        return pandas.read_pickle(self.bg_values_path(state))
+
+    # API
 
     def _query(self, variables, geography='us', inside=None):
         """
@@ -95,9 +238,43 @@ class ACS(object):
             The first list contains the variable names while the others
             carry the requested values.
         """
+        names, columns = self._query_columns(variables, geography, inside)
+        return [names] + [list(row) for row in zip(*columns)]
+
+    def _query_columns(self, variables, geography='us', inside=None):
+        """
+        Query the ACS API and return the result by columns
+
+        The response is decoded while it is downloaded, straight into
+        the columns, so that neither the whole text nor the list of
+        rows is ever kept in memory.
+
+        Parameters
+        ----------
+        variables : list of str
+            See _query.
+        geography : str, default 'us'
+            See _query.
+        inside : str, default None
+            See _query.
+
+        Returns
+        -------
+        names, columns
+            A list of column names and a list with the values of each
+            column.
+        """
         # API limit
         assert len(variables) <= 50
 
+        # ACS estimates for a given year never change
+        cache_key = ['columns', self.base_url, self.year, list(variables),
+                     geography, inside]
+        if self.cache is not None:
+            o = self.cache.get(cache_key)
+            if o is not None:
+                return o
+
         # generate query params
         params = {
             'get': ','.join(variables),
@@ -108,20 +285,66 @@ class ACS(object):
         if self.key != '':
             params['key'] = self.key
 
-        # generate headers
-        ua = util.get_configuration()['Downloads']['UserAgent']
-        headers = {'User-Agent': ua}
-
         # generate query url
-        query_url = f'https://api.census.gov/data/{self.year}/acs/acs5'
+        query_url = f'{self.base_url}/{self.year}/acs/acs5'
 
-        r = requests.get(query_url, params=params, headers=headers)
-        r.raise_for_status()
+        o = self._get_columns(query_url, params)
 
-        o = r.json()
+        if self.cache is not None:
+            self.cache.put(cache_key, o)
 
         return o
 
+    def _get_columns(self, url, params):
+        """
+        Make a GET request and decode its response by columns
+
+        Transient failures (including connections broken while the
+        response is downloaded) are retried, each retry waiting twice
+        as long as the previous one (or as long as the server asks,
+        through the Retry-After header). Requests are also throttled by
+        the rate limiter, if any.
+
+        Returns
+        -------
+        names, columns
+            See _query_columns.
+        """
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            try:
+                r = self.session.get(url, params=params, stream=True,
+                                     timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                time.sleep(_BACKOFF * 2 ** attempt)
+                continue
+
+            # streamed responses hold their connection until closed
+            try:
+                if r.status_code in _RETRY_STATUSES and not last:
+                    retry_after = r.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        wait = int(retry_after)
+                    else:
+                        wait = _BACKOFF * 2 ** attempt
+                else:
+                    r.raise_for_status()
+                    return _decode_columns(r.iter_content(2 ** 16))
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError):
+                if last:
+                    raise
+                wait = _BACKOFF * 2 ** attempt
+            finally:
+                r.close()
+
+            time.sleep(wait)
+
     def data(self, variables, geography='us', inside=None):
         """
         Query the ACS API and return the result as a pandas DataFrame
@@ -187,6 +410,119 @@ class ACS(object):
         >>> inside = 'state:01 county:001'
         >>> df = acs.data(variables, geography, inside)
         """
+        return self.data_many(variables, geography, [inside])
+
+    def data_many(self, variables, geography='us', insides=(None,)):
+        """
+        Query the ACS API for many areas and return a single DataFrame
+
+        The requests for every area (and every chunk of 50 variables)
+        are made concurrently, up to max_workers at a time. The result
+        is the same as concatenating the results of data() for each
+        area, in the given order.
+
+        Parameters
+        ----------
+        variables : list or dict
+            See data().
+        geography : str, default 'us'
+            See data().
+        insides : list of str
+            Each one restricts the search inside an area, as in the
+            'inside' argument of data().
+
+        Returns
+        -------
+        pandas.DataFrame
+
+        Examples
+        --------
+        Retrieve variable for all tracts inside two counties of Alabama:
+
+        >>> acs = ACS()
+        >>> variables = ['B01001_001E']
+        >>> geography = 'tract'
+        >>> insides = ['state:01 county:001', 'state:01 county:003']
+        >>> df = acs.data_many(variables, geography, insides)
+        """
+        return self.data_batch([(variables, geography, insides)])[0]
+
+    def data_batch(self, batch):
+        """
+        Query the ACS API for many requests in a single planned batch
+
+        The variables of all requests for the same geography and area
+        are merged (without duplicates) and split into chunks of 50, so
+        that requests sharing areas share queries too. All queries are
+        then made concurrently, up to max_workers at a time, and each
+        request gets the same result it would get from data_many().
+
+        Parameters
+        ----------
+        batch : list of tuples
+            Each one is (variables, geography, insides), as the
+            arguments of data_many().
+
+        Returns
+        -------
+        list of pandas.DataFrame
+            One for each request, in the same order.
+
+        Examples
+        --------
+        Retrieve a variable for tracts and block groups of a county:
+
+        >>> acs = ACS()
+        >>> variables = ['B01001_001E']
+        >>> inside = 'state:01 county:001'
+        >>> tracts, bgs = acs.data_batch([
+        ...     (variables, 'tract', [inside]),
+        ...     (variables, 'block group', [inside]),
+        ... ])
+        """
+        batch = [_Request(*request) for request in batch]
+
+        # plan: merge the variables of each (geography, inside)
+        merged = {}
+        for request in batch:
+            for inside in request.insides:
+                group = merged.setdefault((request.geography, inside), {})
+                group.update(dict.fromkeys(request.query_vars))
+
+        # split variables into chunks of 50, for each group
+        queries = []
+        for (geography, inside), query_vars in merged.items():
+            for chunk in util.misc.grouper(list(query_vars), 50):
+                queries.append((chunk, geography, inside))
+
+        def query(chunk, geography, inside):
+            # convert as soon as each query finishes, so that the raw
+            # strings of every query are not all kept until the end
+            names, columns = self._query_columns(chunk, geography, inside)
+            return names, _convert_columns(names, columns, chunk)
+
+        # map() keeps the order of the queries
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as ex:
+            results = list(ex.map(lambda q: query(*q), queries))
+
+        # gather the columns of each group
+        group_results = {}
+        for (_, geography, inside), result in zip(queries, results):
+            group_results.setdefault((geography, inside), []).append(result)
+        group_columns = {}
+        for key, results in group_results.items():
+            columns = _columns_from_chunks(results)
+            geo_names = [name for name in columns if name not in merged[key]]
+            group_columns[key] = (columns, geo_names)
+
+        return [request.frame(group_columns) for request in batch]
+
+
+class _Request(object):
+    """
+    I represent a request for ACS data, as planned by ACS.data_batch
+    """
+    def __init__(self, variables, geography='us', insides=(None,)):
         if isinstance(variables, list):
             query_vars = variables
             rename_vars = None
@@ -196,25 +532,48 @@ class ACS(object):
         else:
             raise TypeError("wrong type for argument 'variables'")
 
-        dframes = []
-        # split variables into chunks of 50
-        for chunk in util.misc.grouper(query_vars, 50):
-            json_result = self._query(chunk, geography, inside)
+        insides = list(insides)
+        if not insides:
+            raise ValueError("at least one area must be given in 'insides'")
+
+        # remove duplicate variables
+        self.query_vars = list(dict.fromkeys(query_vars))
+        self.rename_vars = rename_vars
+        self.geography = geography
+        self.insides = insides
 
-            # generate DataFrame from chunk result
-            columns = json_result[0]
-            values = json_result[1:]
-            dframe_result = pandas.DataFrame(values, columns=columns)
-            dframes.append(dframe_result)
+    def frame(self, group_columns):
+        """
+        Build the resulting DataFrame from the columns of the queries
 
-        result = pandas.concat(dframes, axis=1)
+        Parameters
+        ----------
+        group_columns : dict
+            Mapping of (geography, inside) to pairs of (columns, names
+            of the geography columns), where columns are returned by
+            _columns_from_chunks.
 
-        # remove duplicate columns (caused by split requests)
-        result = result.loc[:, ~result.columns.duplicated(keep='last')]
+        Returns
+        -------
+        pandas.DataFrame
+        """
+        # gather the (already converted) parts of each column, for all
+        # areas
+        parts = {}
+        for inside in self.insides:
+            columns, geo_names = group_columns[self.geography, inside]
+            # geography codes (e.g. state, county, tract) come last
+            for name in self.query_vars + geo_names:
+                parts.setdefault(name, []).append(columns[name])
 
-        # convert column values to numbers
-        numeric_vars = [x for x in query_vars if x not in _NONNUMERIC_VARS]
-        result[numeric_vars] = result[numeric_vars].apply(pandas.to_numeric)
+        columns = {}
+        for name, arrays in parts.items():
+            if isinstance(arrays[0], pandas.Categorical):
+                columns[name] = pandas.api.types.union_categoricals(
+                    arrays, sort_categories=True)
+            else:
+                columns[name] = numpy.concatenate(arrays)
+        result = pandas.DataFrame(columns, columns=list(parts))
 
         # check if there are columns whose values are all NaN (GH19)
         all_nans = result.isnull().all()
@@ -223,10 +582,604 @@ class ACS(object):
             wmsg = ("The Census API returned an all null column for some"
                     " variables: {}. You can make sure that they are available"
                     " at the requested geography level {!r}.")
-            wmsg = wmsg.format(columns, geography)
+            wmsg = wmsg.format(columns, self.geography)
             warnings.warn(wmsg, UserWarning)
 
-        if rename_vars is not None:
-            result = result.rename(columns=rename_vars)
+        if self.rename_vars is not None:
+            result = result.rename(columns=self.rename_vars)
 
         return result
+
+
+class _TokenBucket(object):
+    """
+    I will limit the rate of requests, allowing for small bursts
+
+    Tokens are added to the bucket at a constant rate, up to its
+    capacity, and each request takes one token, waiting if the bucket
+    is empty. Safe for use by many threads.
+    """
+    def __init__(self, rate, capacity):
+        """
+        Initialize a new (full) bucket
+
+        Parameters
+        ----------
+        rate : float
+            Number of tokens added per second.
+        capacity : int
+            Maximum number of tokens in the bucket.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token from the bucket, waiting until one is available
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._last) * self.rate,
+            )
+            self._last = now
+
+            # the token is reserved now, even if we have to wait for it
+            self._tokens -= 1
+            wait = -self._tokens / self.rate
+
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _configured_variables():
+    """
+    Return the variables to download, as in the configuration file
+
+    Returns
+    -------
+    dict
+        Mapping of variable names to local names (including the margins
+        of error, if enabled).
+    """
+    variables = util.configuration.get_acs_variables()
+    variables.update(util.configuration.get_acs_moe_variables())
+    return variables
+
+
+def _get_session(pool_size):
+    """
+    Return the HTTP session used for querying the ACS API
+
+    Sessions are shared by all ACS objects (with the same pool size) of
+    a run, so that connections to the API are kept alive and reused
+    across queries, areas and departments.
+
+    Parameters
+    ----------
+    pool_size : int
+        Maximum number of connections kept open to the API.
+
+    Returns
+    -------
+    requests.Session
+    """
+    with _SESSIONS_LOCK:
+        if pool_size not in _SESSIONS:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=pool_size,
+                pool_block=True,
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            ua = util.get_configuration()['Downloads']['UserAgent']
+            session.headers['User-Agent'] = ua
+            _SESSIONS[pool_size] = session
+        return _SESSIONS[pool_size]
+
+
+# Summary levels of the geographies (in the summary files)
+_SUMMARY_LEVELS = {
+    'state': '040',
+    'county': '050',
+    'tract': '140',
+    'block group': '150',
+}
+
+
+# Geography codes returned with each geography (as in the API)
+_GEOGRAPHY_HIERARCHY = {
+    'state': ['state'],
+    'county': ['state', 'county'],
+    'tract': ['state', 'county', 'tract'],
+    'block group': ['state', 'county', 'tract', 'block group'],
+}
+
+
+# Positions of the used columns in the summary files' geography files
+_GEOGRAPHY_FILE_COLUMNS = {
+    'SUMLEVEL': 2,
+    'COMPONENT': 3,
+    'LOGRECNO': 4,
+    'state': 9,
+    'county': 10,
+    'tract': 13,
+    'block group': 14,
+    'NAME': 49,
+}
+
+
+# Whitespace between JSON values
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+# HTTP statuses worth retrying (the API is overloaded or restarting)
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# Seconds to wait before the first retry (doubled for every retry)
+_BACKOFF = 1.0
+
+
+# Sessions by pool size (see _get_session)
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+class _ResponseCache(object):
+    """
+    I will keep responses from the ACS API on disk
+
+    Each response is stored in its own JSON file, named after a hash of
+    the query. The access time of the responses is tracked through the
+    modification time of the files, so that the least recently used
+    ones are removed first when the cache grows above max_size.
+    """
+    def __init__(self, directory, max_size):
+        """
+        Initialize a new cache
+
+        Parameters
+        ----------
+        directory : str or pathlib.Path
+            Where the responses are stored. Created if needed.
+        max_size : int
+            Maximum total size of the stored responses, in bytes.
+        """
+        self.directory = pathlib.Path(directory)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        """
+        Return the path of the file that stores the response for key
+        """
+        key = json.dumps(key, separators=(',', ':'))
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return self.directory / f'{digest}.json'
+
+    def get(self, key):
+        """
+        Return the cached response for key, or None if not cached
+
+        Parameters
+        ----------
+        key : list
+            Query parameters, as a JSON serializable object.
+        """
+        path = self._path(key)
+        try:
+            with open(path, mode='r') as f:
+                response = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return response
+
+    def put(self, key, response):
+        """
+        Store the response for key, evicting old responses if needed
+
+        Parameters
+        ----------
+        key : list
+            Query parameters, as a JSON serializable object.
+        response : list of lists
+            As returned by the API.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+
+        # write atomically, so readers never see partial files
+        tmp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        with open(tmp_path, mode='w') as f:
+            json.dump(response, f)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        """
+        Remove least recently used responses until below max_size
+        """
+        entries = []
+        for path in self.directory.glob('*.json'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            util.file.maybe_rmfile(path)
+            total -= size
+
+
+class SummaryFileACS(ACS):
+    """
+    I will answer the same queries as ACS, but from local summary files
+
+    The ACS 5-year summary files are the bulk version of the data in
+    the API. They must be extracted into a single directory, with the
+    geography files (e.g. g20165al.csv), the sequence files with the
+    estimates (e.g. e20165al0001000.txt) and margins of error (e.g.
+    m20165al0001000.txt), and the sequence/table number lookup file.
+
+    The geography file of a state is indexed on first use, so that
+    queries inside a state (or county) only look at the matching rows.
+    Only the state, county, tract and block group geographies are
+    supported.
+
+    Ref:
+
+    https://www.census.gov/programs-surveys/acs/data/summary-file.html
+    """
+    def __init__(self, directory, year=None, max_workers=None):
+        """
+        Initialize a new SummaryFileACS object
+
+        Parameters
+        ----------
+        directory : str or pathlib.Path
+            Where the summary files are.
+        year : None or int, default None
+            See ACS.
+        max_workers : None or int, default None
+            See ACS.
+        """
+        super().__init__(year=year, key='', max_workers=max_workers,
+                         cache_size=0, max_retries=0, rate=0)
+        self.directory = pathlib.Path(directory)
+        self._geographies = {}
+        self._sequences = {}
+        self._tables = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """
+        Represent the SummaryFileACS object
+        """
+        return (f"SummaryFileACS(directory={str(self.directory)!r},"
+                f" year={self.year!r}, max_workers={self.max_workers!r})")
+
+    def _query_columns(self, variables, geography='us', inside=None):
+        """
+        Query the summary files and return the result by columns
+
+        Same as ACS._query_columns, but for local files.
+        """
+        if geography not in _SUMMARY_LEVELS:
+            raise ValueError(f"geography must be one of"
+                             f" {sorted(_SUMMARY_LEVELS)}")
+        filters = dict(x.split(':') for x in (inside or '').split())
+        if 'state' not in filters:
+            raise ValueError("the state must be specified in 'inside'")
+
+        state = filters.pop('state')
+        geos, by_county = self._geography_index(state)[
+            _SUMMARY_LEVELS[geography]]
+        county = filters.pop('county', '*')
+        if county != '*':
+            geos = by_county.get(county, geos.iloc[:0])
+        for name, code in filters.items():
+            if code != '*':
+                geos = geos[geos[name] == code]
+        logrecnos = geos.index
+
+        columns = []
+        for variable in variables:
+            if variable == 'NAME':
+                columns.append(geos['NAME'].tolist())
+            else:
+                columns.append(self._values(state, variable, logrecnos))
+
+        # geography codes come last, as in the API
+        names = list(variables)
+        for name in _GEOGRAPHY_HIERARCHY[geography]:
+            names.append(name)
+            columns.append(geos[name].tolist())
+
+        return names, columns
+
+    def _geography_index(self, state):
+        """
+        Return the geographies of a state, by summary level
+
+        Returns
+        -------
+        dict
+            Mapping of summary levels to pairs of (geographies, the
+            same geographies by county). Geographies are DataFrames
+            indexed by logical record number, with the geography codes
+            and names.
+        """
+        with self._lock:
+            if state not in self._geographies:
+                abbr = us.states.lookup(state).abbr.lower()
+                path = self.directory / f'g{self.year}5{abbr}.csv'
+                geos = pandas.read_csv(
+                    path,
+                    header=None,
+                    usecols=list(_GEOGRAPHY_FILE_COLUMNS.values()),
+                    dtype=str,
+                    encoding='latin-1',
+                )
+                geos.columns = [
+                    name for name, _ in sorted(
+                        _GEOGRAPHY_FILE_COLUMNS.items(),
+                        key=lambda item: item[1],
+                    )
+                ]
+                geos = geos[geos['COMPONENT'] == '00']
+                geos['LOGRECNO'] = geos['LOGRECNO'].astype(int)
+                geos = geos.set_index('LOGRECNO')
+                index = {}
+                for level, frame in geos.groupby('SUMLEVEL'):
+                    frame = frame.drop(['SUMLEVEL', 'COMPONENT'], axis=1)
+                    by_county = dict(list(frame.groupby('county')))
+                    index[level] = (frame, by_county)
+                self._geographies[state] = index
+            return self._geographies[state]
+
+    def _values(self, state, variable, logrecnos):
+        """
+        Return the values of a variable for the given logical records
+
+        Missing values are represented as None, as in the API.
+        """
+        table, line = variable[:-1].rsplit('_', 1)
+        kind = variable[-1].lower()
+        if kind not in ('e', 'm'):
+            raise ValueError(f"unknown variable: {variable!r}")
+
+        tables = self._table_index()
+        if table not in tables:
+            raise ValueError(f"unknown variable: {variable!r}")
+        sequence, start = tables[table]
+
+        values = self._sequence(state, kind, sequence)
+        values = values[start + int(line) - 1].reindex(logrecnos)
+        return [None if pandas.isnull(x) else x for x in values]
+
+    def _table_index(self):
+        """
+        Return the sequence number and start position of each table
+        """
+        with self._lock:
+            if self._tables is None:
+                path, = self.directory.glob('*Table_Number_Lookup*')
+                lookup = pandas.read_csv(path, dtype=str,
+                                         encoding='latin-1')
+                lookup = lookup.dropna(subset=['Start Position'])
+                self._tables = {
+                    row['Table ID']: (
+                        int(row['Sequence Number']),
+                        int(float(row['Start Position'])),
+                    )
+                    for _, row in lookup.iterrows()
+                }
+            return self._tables
+
+    def _sequence(self, state, kind, sequence):
+        """
+        Return a sequence file, indexed by logical record number
+
+        The columns are the (1-based) positions in the file.
+        """
+        key = (state, kind, sequence)
+        with self._lock:
+            if key not in self._sequences:
+                abbr = us.states.lookup(state).abbr.lower()
+                path = (self.directory /
+                        f'{kind}{self.year}5{abbr}{sequence:04d}000.txt')
+                values = pandas.read_csv(path, header=None, dtype=str,
+                                         na_values=['.'])
+                values.columns = range(1, values.shape[1] + 1)
+                values = values.set_index(values[6].astype(int))
+                self._sequences[key] = values
+            return self._sequences[key]
+
+
+def from_configuration():
+    """
+    Return the ACS backend specified in the configuration file
+
+    Returns
+    -------
+    ACS
+        A SummaryFileACS, if a directory with summary files is
+        specified, otherwise an ACS using the web API.
+    """
+    config = util.get_configuration()
+    directory = config['Census'].get('SummaryFiles', '')
+    if directory:
+        return SummaryFileACS(util.path.BASE_DIR / directory)
+    return ACS()
+
+
+def _columns_from_chunks(results):
+    """
+    Gather the columns from the results of split requests for an area
+
+    Parameters
+    ----------
+    results : list of tuples
+        As returned by ACS._query_columns (possibly with the columns
+        converted by _convert_columns), one for each chunk of
+        variables.
+
+    Returns
+    -------
+    dict
+        Mapping of column names to their values. Columns present
+        in many chunks (like the geography codes) appear only once, at
+        the position of their last occurrence.
+    """
+    columns = {}
+    for names, values in results:
+        for name, column in zip(names, values):
+            columns.pop(name, None)
+            columns[name] = column
+    return columns
+
+
+def _convert_columns(names, columns, variables):
+    """
+    Convert the raw columns of a query to compact arrays
+
+    Parameters
+    ----------
+    names, columns
+        As returned by ACS._query_columns.
+    variables : list of str
+        Variables of the query. Other columns are geography codes.
+
+    Returns
+    -------
+    list
+        Object arrays for non-numeric variables, numeric arrays (see
+        _to_numeric) for the other variables and Categoricals for the
+        geography codes.
+    """
+    converted = []
+    for name, values in zip(names, columns):
+        if name in _NONNUMERIC_VARS:
+            converted.append(numpy.array(values, dtype=object))
+        elif name in variables:
+            converted.append(_to_numeric(values))
+        else:
+            converted.append(pandas.Categorical(values))
+    return converted
+
+
+def _decode_columns(chunks):
+    """
+    Decode a JSON array of rows, incrementally, into columns
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+        Consecutive pieces of an UTF-8 encoded JSON array of arrays, the
+        first of which holds the column names (as the API returns).
+
+    Returns
+    -------
+    names, columns
+        See ACS._query_columns.
+    """
+    rows = _iter_json_rows(chunks)
+    try:
+        names = next(rows)
+    except StopIteration:
+        raise ValueError("the response has no header")
+
+    columns = [[] for _ in names]
+    for row in rows:
+        if len(row) != len(names):
+            raise ValueError("the rows of the response differ in length")
+        for column, value in zip(columns, row):
+            column.append(value)
+    return names, columns
+
+
+def _iter_json_rows(chunks):
+    """
+    Yield the elements of a JSON array of arrays, as they are complete
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += text_decoder.decode(chunk)
+
+        # move a position along the buffer (slicing it for every row
+        # would copy it over and over)
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("the response is not a JSON array")
+                started = True
+                pos += 1
+            elif buffer[pos] == ',':
+                pos += 1
+            elif buffer[pos] == ']':
+                return
+            else:
+                try:
+                    row, pos = decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    # incomplete row, wait for the next chunk
+                    break
+                yield row
+        buffer = buffer[pos:]
+    raise ValueError("the response ended before the JSON array")
+
+
+def _to_numeric(values):
+    """
+    Convert raw values from the API into a compact numeric array
+
+    Parameters
+    ----------
+    values : sequence of str, int, float or None
+        None represents a missing value.
+
+    Returns
+    -------
+    numpy.ndarray
+        int32, if all values are integers that fit into it, otherwise
+        float64 (with NaN for missing values).
+    """
+    try:
+        array = numpy.array(values, dtype=float)
+    except TypeError:
+        values = [numpy.nan if x is None else x for x in values]
+        array = numpy.array(values, dtype=float)
+
+    int32 = numpy.iinfo(numpy.int32)
+    if (numpy.isfinite(array).all() and
+            (array >= int32.min).all() and
+            (array <= int32.max).all() and
+            (array == numpy.floor(array)).all()):
+        return array.astype(numpy.int32)
+    return array
@@ -17,7 +17,7 @@ import pandas
 import us
 
 from cpe_help import util
-from cpe_help.acs import ACS
+from cpe_help.acs import from_configuration as acs_from_configuration
 from cpe_help.tiger import TIGER
 
 
@@ -67,6 +67,7 @@ class Department():
             self.raw_dir,
             self.preprocessed_dir,
             self.processed_dir,
+            self.interpolation_cache_dir,
             self.input_dir,
             self.tabular_input_dir,
             self.spatial_input_dir,
@@ -89,6 +90,10 @@ class Department():
     def processed_dir(self):
         return self.path / 'processed'
 
+    @property
+    def interpolation_cache_dir(self):
+        return self.processed_dir / 'interpolation_cache'
+
     @property
     def preprocessed_shapefile_path(self):
         return self.preprocessed_dir / 'shapefile.zip'
@@ -393,18 +398,16 @@ class Department():
         Guess the counties that make part of this city and department
         """
         city = self.load_city_metadata()
-        counties = TIGER().load_county_boundaries()
         precincts = self.load_preprocessed_shapefile()
 
         # speed things up
-        city = city.to_crs(counties.crs)
-        precincts = precincts.to_crs(counties.crs)
+        precincts = precincts.to_crs(city.crs)
 
         shape1 = city.geometry.iloc[0]
         shape2 = precincts.unary_union
         union = shape1.union(shape2)
 
-        counties = counties[counties.intersects(union)]
+        counties = TIGER().load_county_boundaries(intersects=union)
 
         # set up equal area projection
         proj = util.crs.equal_area_from_geodf(city)
@@ -431,18 +434,18 @@ class Department():
         """
         tiger = TIGER()
 
-        places = tiger.load_place_boundaries(self.state.fips)
         police = self.load_preprocessed_shapefile()
-        police = police.to_crs(places.crs)
+        police = police.to_crs(util.crs.DEFAULT)
 
         # we want to avoid statistical entities
         # ref: https://www.census.gov/geo/reference/funcstat.html
         # the 'F' is left here for Indianopolis
         # ref: https://en.wikipedia.org/wiki/Indianapolis#Demographics
-        places = places[places['FUNCSTAT'].isin(['A', 'F'])]
-
-        # speeding things up
-        places = places[places.intersects(police.unary_union)]
+        places = tiger.load_place_boundaries(
+            self.state.fips,
+            funcstat=['A', 'F'],
+            intersects=police.unary_union,
+        )
 
         proj = util.crs.equal_area_from_geodf(places)
         places = places.to_crs(proj)
@@ -453,71 +456,69 @@ class Department():
 
         self.save_guessed_city(city_name)
 
-    def download_tract_values(self):
+    def extract_tract_values(self):
         """
-        Download ACS values for relevant census tracts
+        Extract ACS values for relevant census tracts
 
         Relevant census tracts are those inside counties that compose
-        this department.
+        this department. The values are sliced from the ones downloaded
+        for the whole state.
         """
-        acs = ACS()
+        acs = acs_from_configuration()
         state = self.load_guessed_state()
         counties = self.load_guessed_counties()
-        variables = util.configuration.get_acs_variables()
-
-        # must make 1 request per county
-        frames = []
-        for county in counties:
-            df = acs.data(
-                variables,
-                geography='tract',
-                inside='state:{} county:{}'.format(state, county),
-            )
-            frames.append(df)
-        frame = pandas.concat(frames)
-        self.save_tract_values(frame)
-
-    def download_bg_values(self):
+
+        values = acs.load_tract_values(state)
+        values = values[values['county'].isin(counties)]
+        self.save_tract_values(values)
+
+    def extract_bg_values(self):
         """
-        Download ACS values for relevant block groups
+        Extract ACS values for relevant block groups
 
         Relevant block groups are those inside counties that compose
-        this department.
+        this department. The values are sliced from the ones downloaded
+        for the whole state.
         """
-        acs = ACS()
+        acs = acs_from_configuration()
         state = self.load_guessed_state()
         counties = self.load_guessed_counties()
-        variables = util.configuration.get_acs_variables()
-
-        # must make 1 request per county
-        frames = []
-        for county in counties:
-            df = acs.data(
-                variables,
-                geography='block group',
-                inside='state:{} county:{}'.format(state, county),
-            )
-            frames.append(df)
-        frame = pandas.concat(frames)
-        self.save_bg_values(frame)
-
-    def process_city(self):
-        """
-        Generate statistics for my city
 
-        The statistics are extracted from the BGs that intersect with
-        the city.
+        values = acs.load_bg_values(state)
+        values = values[values['county'].isin(counties)]
+        self.save_bg_values(values)
 
-        See also
-        --------
-        Department.process_police_precincts
+    def process_city_and_police_precincts(self):
+        """
+        Generate statistics for my city and my police precincts
+
+        The statistics are interpolated from the block groups, in a
+        single pass for both targets. The outputs are joins between the
+        original geographies (the city from TIGER and the externally
+        provided shapefile) and the interpolated Census data.
         """
         city = self.load_city_metadata()
+        police = self.load_preprocessed_shapefile()
         bgs = self.load_block_groups()
-        new_city = util.interpolation.weighted_areas(bgs, city.geometry)
+
+        moe = util.configuration.get_acs_moe_columns()
+        bgs, flags = _flag_unavailable_moes(bgs, moe.values())
+
+        new_city, new_police = util.interpolation.weighted_areas_many(
+            bgs,
+            [city.geometry, police.geometry],
+            cache_dir=self.interpolation_cache_dir,
+            moe=moe,
+        )
+        new_city = _drop_unavailable_moes(new_city, flags)
+        new_police = _drop_unavailable_moes(new_police, flags)
+
         joined = city.join(new_city.drop('geometry', axis=1))
         self.save_city(joined)
 
+        joined = police.join(new_police.drop('geometry', axis=1))
+        self.save_police_precincts(joined)
+
     def process_census_tracts(self):
         """
         Merge census tract values with geography (for intersecting
@@ -528,11 +529,8 @@ class Department():
         state = self.load_guessed_state()
         counties = self.load_guessed_counties()
 
-        boundaries = tiger.load_tract_boundaries(state)
-        boundaries = boundaries[
-            (boundaries['STATEFP'] == state) &
-            (boundaries['COUNTYFP'].isin(counties))
-        ]
+        boundaries = tiger.load_tract_boundaries(state, counties=counties)
+        boundaries = boundaries[boundaries['STATEFP'] == state]
         values = self.load_tract_values()
         assert boundaries.shape[0] == values.shape[0]
 
@@ -541,6 +539,8 @@ class Department():
         to_join1 = to_join1[['geometry']]
 
         index2 = ['state', 'county', 'tract']
+        # geography codes are categorical in the ACS values
+        values[index2] = values[index2].astype(str)
         to_join2 = values.set_index(index2)
 
         to_join1.index.names = to_join2.index.names
@@ -565,11 +565,8 @@ class Department():
         state = self.load_guessed_state()
         counties = self.load_guessed_counties()
 
-        boundaries = tiger.load_bg_boundaries(state)
-        boundaries = boundaries[
-            (boundaries['STATEFP'] == state) &
-            (boundaries['COUNTYFP'].isin(counties))
-        ]
+        boundaries = tiger.load_bg_boundaries(state, counties=counties)
+        boundaries = boundaries[boundaries['STATEFP'] == state]
         values = self.load_bg_values()
         assert boundaries.shape[0] == values.shape[0]
 
@@ -578,6 +575,8 @@ class Department():
         to_join1 = to_join1[['geometry']]
 
         index2 = ['state', 'county', 'tract', 'block group']
+        # geography codes are categorical in the ACS values
+        values[index2] = values[index2].astype(str)
         to_join2 = values.set_index(index2)
 
         to_join1.index.names = to_join2.index.names
@@ -593,20 +592,6 @@ class Department():
 
         self.save_block_groups(joined)
 
-    def process_police_precincts(self):
-        """
-        Generate police precincts file
-
-        This currently made as a join between the externally provided
-        shapefiles (proprocessed_shapefile) data and data that comes
-        from the Census interpolated into the relevant regions.
-        """
-        police = self.load_preprocessed_shapefile()
-        bgs = self.load_block_groups()
-        new_police = util.interpolation.weighted_areas(bgs, police.geometry)
-        joined = police.join(new_police.drop('geometry', axis=1))
-        self.save_police_precincts(joined)
-
     def generate_sc_markdown(self):
         """
         Generate sanity check report in markdown
@@ -1076,3 +1061,64 @@ def list_states():
     """
     dept_coll = DepartmentCollection()
     return dept_coll.load_list_of_states()
+
+
+def _flag_unavailable_moes(df, columns):
+    """
+    Replace the annotation codes of the Census in MOE columns
+
+    The Census uses negative codes for MOEs that are not numbers.
+    -555555555 means that the estimate is controlled, so its MOE is 0.
+    The other codes (e.g. -222222222, too few observations, or
+    -333333333, open-ended median) mean that the MOE is not available.
+    These are replaced by 0 too, but flagged in new (extensive) columns,
+    so that the MOEs interpolated from them can be dropped afterwards
+    (see _drop_unavailable_moes).
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+    columns : list of str
+        The MOE columns.
+
+    Returns
+    -------
+    df, flags
+        A copy of df, with the codes replaced and the flag columns
+        added, and a dict mapping each MOE column to its flag column.
+    """
+    df = df.copy()
+    flags = {}
+    for column in columns:
+        values = df[column]
+        flag = f'{column}_UNAVAILABLE'
+        df[flag] = ((values < 0) & (values != _CONTROLLED_MOE)).astype(float)
+        df[column] = values.clip(lower=0)
+        flags[column] = flag
+    return df, flags
+
+
+def _drop_unavailable_moes(df, flags):
+    """
+    Set to NaN the MOEs interpolated from unavailable ones
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Interpolated from a frame returned by _flag_unavailable_moes.
+    flags : dict
+        As returned by _flag_unavailable_moes.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A copy of df, without the flag columns.
+    """
+    df = df.copy()
+    for column, flag in flags.items():
+        df.loc[df[flag] > 0, column] = float('nan')
+    return df.drop(list(flags.values()), axis=1)
+
+
+# Annotation of the MOEs of controlled estimates
+_CONTROLLED_MOE = -555555555
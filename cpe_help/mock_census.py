@@ -0,0 +1,233 @@
+"""
+A local stand-in for the Census API, for tests and benchmarks
+
+The server answers the same queries as https://api.census.gov/data,
+from a fixture, optionally adding latency and injecting errors. Point
+an ACS object to it through base_url:
+
+>>> with MockCensusServer(latency=0.05) as server:
+...     acs = ACS(base_url=server.url, cache_size=0)
+...     df = acs.data(['B01001_001E'], 'tract', 'state:01')
+...     server.request_count
+"""
+
+import http.server
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+import zlib
+
+from cpe_help.acs import _GEOGRAPHY_HIERARCHY
+
+
+class SyntheticCensus(object):
+    """
+    I will make up deterministic ACS data for a fake state
+
+    The state has n_counties counties, each with n_tracts tracts, each
+    with n_block_groups block groups. Values depend only on the
+    variable and on the geography, so repeated queries agree.
+    """
+    def __init__(self, state='01', n_counties=3, n_tracts=4,
+                 n_block_groups=3):
+        self.state = state
+        self.n_counties = n_counties
+        self.n_tracts = n_tracts
+        self.n_block_groups = n_block_groups
+
+    def __repr__(self):
+        return (f"SyntheticCensus(state={self.state!r},"
+                f" n_counties={self.n_counties!r},"
+                f" n_tracts={self.n_tracts!r},"
+                f" n_block_groups={self.n_block_groups!r})")
+
+    def _geographies(self, geography):
+        """
+        Return the geography codes of all areas of a geography level
+        """
+        counties = [f'{2 * i + 1:03d}' for i in range(self.n_counties)]
+        tracts = [f'{i + 1:04d}00' for i in range(self.n_tracts)]
+        bgs = [f'{i + 1}' for i in range(self.n_block_groups)]
+
+        codes = {
+            'state': [(self.state,)],
+            'county': [(self.state, c) for c in counties],
+            'tract': [(self.state, c, t) for c in counties for t in tracts],
+            'block group': [(self.state, c, t, b)
+                            for c in counties
+                            for t in tracts
+                            for b in bgs],
+        }
+        return codes[geography]
+
+    def _query(self, variables, geography='us', inside=None):
+        """
+        Answer a query as ACS._query would
+        """
+        if geography not in _GEOGRAPHY_HIERARCHY:
+            raise ValueError(f"geography must be one of"
+                             f" {sorted(_GEOGRAPHY_HIERARCHY)}")
+        names = _GEOGRAPHY_HIERARCHY[geography]
+        filters = dict(x.split(':') for x in (inside or '').split())
+
+        result = [list(variables) + names]
+        for codes in self._geographies(geography):
+            codes = dict(zip(names, codes))
+            if any(codes.get(name, code) != code
+                   for name, code in filters.items() if code != '*'):
+                continue
+
+            geoid = ''.join(codes.values())
+            row = []
+            for variable in variables:
+                if variable == 'NAME':
+                    row.append(f'{geography.title()} {geoid}')
+                else:
+                    value = zlib.crc32(f'{variable}:{geoid}'.encode())
+                    row.append(str(value % 10000))
+            result.append(row + list(codes.values()))
+        return result
+
+
+class MockCensusServer(object):
+    """
+    I will serve ACS queries locally, as the Census API would
+
+    Use me as a context manager: the server runs in a background thread
+    while inside the with block.
+    """
+    def __init__(self, fixture=None, latency=0, error_rate=0,
+                 error_status=503, seed=0):
+        """
+        Initialize a new (stopped) server
+
+        Parameters
+        ----------
+        fixture : object, optional
+            Answers the queries, through a _query method with the same
+            signature as ACS._query (e.g. a SummaryFileACS). If None,
+            use a SyntheticCensus.
+        latency : float, default 0
+            Seconds to wait before answering each request.
+        error_rate : float, default 0
+            Probability of answering a request with error_status
+            instead of the data.
+        error_status : int, default 503
+            HTTP status of the injected errors.
+        seed : int, default 0
+            Seed for the injected errors, so that runs are reproducible.
+        """
+        if not 0 <= error_rate <= 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        if latency < 0:
+            raise ValueError("latency cannot be negative")
+
+        self.fixture = fixture if fixture is not None else SyntheticCensus()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.request_count = 0
+        self.error_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """
+        The base URL of the server (to be passed to ACS)
+        """
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        """
+        Start serving, on a free port, in a background thread
+        """
+        handler = type('Handler', (_Handler,), {'mock': self})
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        # a short poll interval makes stop() quick
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True,
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def _respond(self, path, params):
+        """
+        Return the (status, body) of the response to a request
+        """
+        with self._lock:
+            self.request_count += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.error_count += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            return self.error_status, 'injected error'
+
+        if not re.fullmatch(r'/\d{4}/acs/acs5', path):
+            return 404, 'unknown dataset'
+        try:
+            variables = params['get'][0].split(',')
+            geography = params['for'][0].split(':')[0]
+            inside = params.get('in', [None])[0]
+            result = self.fixture._query(variables, geography, inside)
+        except (KeyError, ValueError) as e:
+            return 400, f'error: {e}'
+        return 200, json.dumps(result)
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    # Python 3.6 has no http.server.ThreadingHTTPServer
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    # set by MockCensusServer.start
+    mock = None
+
+    # keep connections alive, as the API does
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        status, body = self.mock._respond(url.path, params)
+
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429 or status == 503:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # do not clutter the output of tests and benchmarks
+        pass
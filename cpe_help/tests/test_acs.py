@@ -2,13 +2,29 @@
 Module for testing the ACS class
 """
 
+import json
+import pathlib
+import time
+
+import numpy as np
+import pandas
 import pytest
+import requests
+from pandas.util.testing import assert_frame_equal
 
-from cpe_help import ACS
+from cpe_help import ACS, SummaryFileACS
+from cpe_help import acs as acs_module
+from cpe_help.acs import (
+    _decode_columns,
+    _ResponseCache,
+    _to_numeric,
+    _TokenBucket,
+)
+from cpe_help.util.configuration import get_configuration
 
 
 def test_simple_query():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = ["NAME", "B01001_002E", "B01001_026E"]
     geography = 'county'
@@ -21,7 +37,7 @@ def test_simple_query():
 
 
 def test_big_query():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = ["B01001_002E"] * 50
     geography = 'county'
@@ -33,7 +49,7 @@ def test_big_query():
 
 
 def test_simple_data():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = ["NAME", "B01001_002E", "B01001_026E"]
     geography = 'county'
@@ -47,7 +63,7 @@ def test_simple_data():
 
 
 def test_big_data():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = ["B01001_002E"] * 50 + ['NAME']
     geography = 'county'
@@ -59,7 +75,7 @@ def test_big_data():
 
 
 def test_hierarchic_inside():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = ["NAME", "B01001_002E", "B01001_026E"]
     geography = 'tract'
@@ -72,7 +88,7 @@ def test_hierarchic_inside():
 
 
 def test_simple_data_dictvariables():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = {
         'NAME': 'Geography Name',
@@ -90,7 +106,7 @@ def test_simple_data_dictvariables():
 
 
 def test_dtypes():
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = ["NAME", "B01001_002E", "B01001_026E"]
     geography = 'county'
@@ -102,9 +118,17 @@ def test_dtypes():
     expected = {'B01001_002E', 'B01001_026E'}
     assert result == expected
 
+    # counts are downcast
+    assert (df[list(expected)].dtypes == 'int32').all()
+
     # object columns (string)
     result = set(c for c in df.select_dtypes('object').columns)
-    expected = {'NAME', 'county', 'state'}
+    expected = {'NAME'}
+    assert result == expected
+
+    # geography codes
+    result = set(c for c in df.select_dtypes('category').columns)
+    expected = {'county', 'state'}
     assert result == expected
 
 
@@ -113,7 +137,7 @@ def test_null_variables():
     # desired level, the Census returns nulls, and the ACS class should
     # generate a warning.
 
-    acs = ACS()
+    acs = ACS(cache_size=0)
 
     variables = {
         'B01001_001E': 'VARIABLE_OKAY',
@@ -131,3 +155,385 @@ def test_null_variables():
     assert set(result.columns) >= set(variables.values())
     # exactly one column with all nulls
     assert result.isnull().all(axis=0).sum() == 1
+
+
+def test_data_many():
+    acs = ACS(cache_size=0)
+
+    variables = ["B01001_002E"] * 50 + ['NAME']
+    geography = 'tract'
+    insides = ['state:01 county:001', 'state:01 county:003']
+    result = acs.data_many(variables, geography, insides)
+
+    expected = [acs.data(variables, geography, inside) for inside in insides]
+    expected = pandas.concat(expected, ignore_index=True)
+    assert_frame_equal(result, expected, check_dtype=False,
+                       check_categorical=False)
+
+
+def test_data_many_order(monkeypatch):
+    # Requests finish in reverse order, but the results should still be
+    # in the order of the areas (and of the variables).
+
+    def _query_columns(self, variables, geography='us', inside=None):
+        county = inside.split(':')[-1]
+        time.sleep(0.01 * (10 - int(county)))
+        names = list(variables) + ['county']
+        columns = [[str(int(county) * int(v[1:4]))] for v in variables]
+        return names, columns + [[county]]
+
+    monkeypatch.setattr(ACS, '_query_columns', _query_columns)
+    acs = ACS(max_workers=4, cache_size=0)
+
+    variables = [f'V{i:03d}_00{i % 10}' for i in range(60)]
+    insides = [f'county:{i}' for i in range(1, 10)]
+    result = acs.data_many(variables, 'county', insides)
+
+    assert result['county'].tolist() == [str(i) for i in range(1, 10)]
+    assert result.columns.tolist()[:60] == variables
+    assert result['V023_003'].tolist() == [i * 23 for i in range(1, 10)]
+
+
+def test_data_many_dtypes(monkeypatch):
+    # Each area is converted on its own, but the result should be the
+    # same as converting all of them at once.
+
+    def _query_columns(self, variables, geography='us', inside=None):
+        county = inside.split(':')[-1]
+        values = {'003': ['1', '2'], '001': ['3', None]}[county]
+        names = list(variables) + ['county']
+        return names, [['Name'] * 2, values, [county] * 2]
+
+    monkeypatch.setattr(ACS, '_query_columns', _query_columns)
+    acs = ACS(cache_size=0)
+
+    result = acs.data_many(['NAME', 'B01001_001E'], 'county',
+                           ['county:003', 'county:001'])
+
+    assert result['NAME'].dtype == object
+    assert result['B01001_001E'].dtype == 'float64'
+    assert result['B01001_001E'].tolist()[:3] == [1, 2, 3]
+    assert result['county'].dtype == 'category'
+    assert result['county'].cat.categories.tolist() == ['001', '003']
+    assert result['county'].tolist() == ['003', '003', '001', '001']
+
+
+def test_shared_session():
+    acs1 = ACS(max_workers=2, cache_size=0)
+    acs2 = ACS(max_workers=2, cache_size=0)
+    assert acs1.session is acs2.session
+    ua = get_configuration()['Downloads']['UserAgent']
+    assert acs1.session.headers['User-Agent'] == ua
+
+
+class _FakeResponse():
+
+    def __init__(self, o, status_code=200, broken=False):
+        self.o = o
+        self.status_code = status_code
+        self.broken = broken
+        self.closed = False
+        self.headers = {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error')
+
+    def json(self):
+        return self.o
+
+    def iter_content(self, chunk_size):
+        content = json.dumps(self.o).encode()
+        for i in range(0, len(content), chunk_size):
+            if self.broken:
+                raise requests.exceptions.ChunkedEncodingError('reset')
+            yield content[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeSession():
+
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, params, stream=False, timeout=None):
+        self.calls += 1
+        variables = params['get'].split(',')
+        return _FakeResponse([variables, ['1'] * len(variables)])
+
+
+def test_cache(tmpdir):
+    acs = ACS(cache_dir=str(tmpdir), cache_size=1)
+    acs.session = _FakeSession()
+
+    result1 = acs._query(['B01001_002E'], 'county', 'state:01')
+    result2 = acs._query(['B01001_002E'], 'county', 'state:01')
+    assert acs.session.calls == 1
+    assert result1 == result2
+
+    acs._query(['B01001_002E'], 'county', 'state:02')
+    assert acs.session.calls == 2
+    assert len(tmpdir.listdir()) == 2
+
+    # the cache is shared between ACS objects of the same year
+    acs = ACS(cache_dir=str(tmpdir), cache_size=1)
+    acs.session = _FakeSession()
+    acs._query(['B01001_002E'], 'county', 'state:01')
+    assert acs.session.calls == 0
+
+
+def test_cache_eviction(tmpdir):
+    cache = _ResponseCache(str(tmpdir), max_size=100)
+    for i in range(10):
+        cache.put([i], [['B01001_002E'], [str(i) * 20]])
+        # the first response is still being used
+        assert cache.get([0]) is not None
+
+    assert sum(f.size() for f in tmpdir.listdir()) <= 100
+    assert cache.get([0]) is not None
+    assert cache.get([9]) is not None
+    assert cache.get([1]) is None
+
+
+def test_no_cache(tmpdir):
+    acs = ACS(cache_dir=str(tmpdir), cache_size=0)
+    acs.session = _FakeSession()
+
+    acs._query(['B01001_002E'], 'county', 'state:01')
+    acs._query(['B01001_002E'], 'county', 'state:01')
+    assert acs.session.calls == 2
+    assert tmpdir.listdir() == []
+
+
+class _FlakySession():
+    """
+    Fake API that fails with the given statuses before succeeding
+
+    A status of None stands for a connection broken mid-response.
+    """
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+        self.responses = []
+
+    def get(self, url, params, stream=False, timeout=None):
+        self.calls += 1
+        o = [['NAME'], ['Alabama']]
+        if not self.statuses:
+            r = _FakeResponse(o)
+        elif self.statuses[0] is None:
+            self.statuses.pop(0)
+            r = _FakeResponse(o, broken=True)
+        else:
+            r = _FakeResponse(None, status_code=self.statuses.pop(0))
+        self.responses.append(r)
+        return r
+
+
+def test_retry(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(acs_module.time, 'sleep', sleeps.append)
+    acs = ACS(cache_size=0, max_retries=3, rate=0)
+    acs.session = _FlakySession([503, 429])
+
+    result = acs._query(['NAME'], 'state', None)
+    assert result == [['NAME'], ['Alabama']]
+    assert acs.session.calls == 3
+    assert sleeps == [1.0, 2.0]
+    assert all(r.closed for r in acs.session.responses)
+
+
+def test_retry_broken_response(monkeypatch):
+    monkeypatch.setattr(acs_module.time, 'sleep', lambda seconds: None)
+    acs = ACS(cache_size=0, max_retries=3, rate=0)
+    acs.session = _FlakySession([None, None])
+
+    result = acs._query(['NAME'], 'state', None)
+    assert result == [['NAME'], ['Alabama']]
+    assert acs.session.calls == 3
+    assert all(r.closed for r in acs.session.responses)
+
+
+def test_retry_gives_up(monkeypatch):
+    monkeypatch.setattr(acs_module.time, 'sleep', lambda seconds: None)
+    acs = ACS(cache_size=0, max_retries=2, rate=0)
+    acs.session = _FlakySession([503] * 10)
+
+    with pytest.raises(requests.HTTPError):
+        acs._query(['NAME'], 'state', None)
+    assert acs.session.calls == 3
+    assert all(r.closed for r in acs.session.responses)
+
+
+def test_no_retry_on_client_error(monkeypatch):
+    monkeypatch.setattr(acs_module.time, 'sleep', lambda seconds: None)
+    acs = ACS(cache_size=0, max_retries=2, rate=0)
+    acs.session = _FlakySession([400])
+
+    with pytest.raises(requests.HTTPError):
+        acs._query(['NAME'], 'state', None)
+    assert acs.session.calls == 1
+
+
+def test_token_bucket():
+    bucket = _TokenBucket(rate=50, capacity=2)
+
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    elapsed = time.monotonic() - start
+
+    # 2 requests in a burst, then 1 every 0.02 seconds
+    assert elapsed >= 0.08
+
+
+def test_to_numeric():
+    result = _to_numeric(['1', '-666666666', '35'])
+    assert result.dtype == 'int32'
+    assert result.tolist() == [1, -666666666, 35]
+
+    result = _to_numeric(['1.5', None, '35'])
+    assert result.dtype == 'float64'
+    assert np.isnan(result[1])
+
+    result = _to_numeric(['1', '3000000000'])
+    assert result.dtype == 'float64'
+
+
+# Fields of the summary files' geography files, in order
+# (ACS 5-year Summary File Technical Documentation, 2016)
+GEOGRAPHY_FILE = [
+    'FILEID', 'STUSAB', 'SUMLEVEL', 'COMPONENT', 'LOGRECNO', 'US',
+    'REGION', 'DIVISION', 'STATECE', 'STATE', 'COUNTY', 'COUSUB', 'PLACE',
+    'TRACT', 'BLKGRP', 'CONCIT', 'AIANHH', 'AIANHHFP', 'AIHHTLI',
+    'AITSCE', 'AITS', 'ANRC', 'CBSA', 'CSA', 'METDIV', 'MACC', 'MEMI',
+    'NECTA', 'CNECTA', 'NECTADIV', 'UA', 'BLANK', 'CDCURR', 'SLDU',
+    'SLDL', 'BLANK', 'BLANK', 'ZCTA5', 'SUBMCD', 'SDELM', 'SDSEC',
+    'SDUNI', 'UR', 'PCI', 'BLANK', 'BLANK', 'PUMA5', 'BLANK', 'GEOID',
+    'NAME', 'BTTR', 'BTBG', 'BLANK',
+]
+
+
+class TestSummaryFileACS():
+    """
+    Tests for reading ACS data from (fake) summary files
+    """
+
+    def setup_method(self):
+        # state 01 has two counties: 001 with two tracts (with one
+        # block group each) and 003 with one tract (with one block group)
+        self.geographies = [
+            # SUMLEVEL, LOGRECNO, COUNTY, TRACT, BLKGRP, NAME
+            ('040', 1, '', '', '', 'Alabama'),
+            ('050', 2, '001', '', '', 'Autauga County'),
+            ('050', 3, '003', '', '', 'Baldwin County'),
+            ('140', 4, '001', '020100', '', 'Tract 201'),
+            ('140', 5, '001', '020200', '', 'Tract 202'),
+            ('140', 6, '003', '010100', '', 'Tract 101'),
+            ('150', 7, '001', '020100', '1', 'BG 1, Tract 201'),
+            ('150', 8, '001', '020200', '1', 'BG 1, Tract 202'),
+            ('150', 9, '003', '010100', '1', 'BG 1, Tract 101'),
+        ]
+
+    def write_files(self, directory):
+        directory = pathlib.Path(str(directory))
+
+        with open(directory / 'g20165al.csv', 'w') as f:
+            for level, logrecno, county, tract, bg, name in self.geographies:
+                fields = {
+                    'FILEID': 'ACSSF',
+                    'STUSAB': 'AL',
+                    'SUMLEVEL': level,
+                    'COMPONENT': '00',
+                    'LOGRECNO': f'{logrecno:07d}',
+                    'STATE': '01',
+                    'COUNTY': county,
+                    'TRACT': tract,
+                    'BLKGRP': bg,
+                    'NAME': name,
+                }
+                row = [fields.get(name, '') for name in GEOGRAPHY_FILE]
+                f.write(','.join(row) + '\n')
+
+        with open(directory / 'ACS_5yr_Seq_Table_Number_Lookup.txt',
+                  'w') as f:
+            f.write('File ID,Table ID,Sequence Number,Line Number,'
+                    'Start Position,Total Cells in Table,'
+                    'Total Cells in Sequence,Table Title,Subject Area\n')
+            f.write('ACSSF,B01001,0001,,7,2 CELLS,,SEX BY AGE,Age-Sex\n')
+            f.write('ACSSF,B01001,0001,1,,,,Total:,\n')
+            f.write('ACSSF,B01001,0001,2,,,,Male:,\n')
+
+        for kind in ['e', 'm']:
+            with open(directory / f'{kind}20165al0001000.txt', 'w') as f:
+                for _, logrecno, *_ in self.geographies:
+                    total = logrecno * 100 if kind == 'e' else logrecno
+                    male = '.' if logrecno == 8 else str(total // 2)
+                    f.write(f'ACSSF,2016{kind}5,al,000,0001,'
+                            f'{logrecno:07d},{total},{male}\n')
+
+    def test_query(self, tmpdir):
+        self.write_files(tmpdir)
+        acs = SummaryFileACS(str(tmpdir), year=2016)
+
+        result = acs._query(['NAME', 'B01001_001E'], 'tract',
+                            'state:01 county:001')
+        assert result == [
+            ['NAME', 'B01001_001E', 'state', 'county', 'tract'],
+            ['Tract 201', '400', '01', '001', '020100'],
+            ['Tract 202', '500', '01', '001', '020200'],
+        ]
+
+    def test_data(self, tmpdir):
+        self.write_files(tmpdir)
+        acs = SummaryFileACS(str(tmpdir), year=2016)
+
+        variables = {
+            'B01001_001E': 'TOTAL',
+            'B01001_002E': 'MALE',
+            'B01001_002M': 'MALE_MOE',
+        }
+        result = acs.data(variables, 'block group', 'state:01 county:*')
+
+        assert result['TOTAL'].tolist() == [700, 800, 900]
+        assert result['MALE'].isnull().tolist() == [False, True, False]
+        assert result['MALE_MOE'].iloc[[0, 2]].tolist() == [3, 4]
+        assert result['block group'].tolist() == ['1', '1', '1']
+
+        result = acs.data(['B01001_001E'], 'county', 'state:01')
+        assert result['county'].tolist() == ['001', '003']
+
+    def test_unknown_variable(self, tmpdir):
+        self.write_files(tmpdir)
+        acs = SummaryFileACS(str(tmpdir), year=2016)
+
+        with pytest.raises(ValueError):
+            acs._query(['B99999_001E'], 'county', 'state:01')
+
+    def test_missing_state(self, tmpdir):
+        acs = SummaryFileACS(str(tmpdir), year=2016)
+
+        with pytest.raises(ValueError):
+            acs._query(['B01001_001E'], 'county')
+
+
+def test_decode_columns():
+    rows = [
+        ['NAME', 'B01001_001E', 'state'],
+        ['Alabama, "AL"', '4841164', '01'],
+        ['Alaska [AK]', None, '02'],
+        ['Doña Ana County', '213598', '35'],
+    ]
+    content = json.dumps(rows, indent=1, ensure_ascii=False).encode()
+
+    expected = (rows[0], [list(column) for column in zip(*rows[1:])])
+    for chunk_size in [1, 7, 1000]:
+        chunks = [content[i:i + chunk_size]
+                  for i in range(0, len(content), chunk_size)]
+        assert _decode_columns(chunks) == expected
+
+    with pytest.raises(ValueError):
+        _decode_columns([content[:-5]])
@@ -0,0 +1,82 @@
+"""
+Module for testing the Department class and its helpers
+"""
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+from cpe_help.department import (
+    _drop_unavailable_moes,
+    _flag_unavailable_moes,
+)
+from cpe_help.util.interpolation import weighted_areas_many
+
+
+class TestUnavailableMOEs():
+    """
+    Tests for the handling of the MOE annotations of the Census
+    """
+
+    def setup_method(self):
+        # three block groups side by side
+        self.bgs = gpd.GeoDataFrame(
+            {
+                'POP': [10, 20, 30],
+                'POP_MOE': [-555555555, 4, -222222222],
+                'INCOME': [100, 200, 300],
+                'INCOME_MOE': [3, -333333333, 4],
+            },
+            geometry=[box(i, 0, i + 1, 1) for i in range(3)],
+        )
+        self.moe = {'POP': 'POP_MOE', 'INCOME': 'INCOME_MOE'}
+
+    def interpolate(self, targets):
+        bgs, flags = _flag_unavailable_moes(self.bgs, self.moe.values())
+        result, = weighted_areas_many(bgs, [targets], ignore_crs=True,
+                                      intensive=['INCOME'], moe=self.moe)
+        return _drop_unavailable_moes(result, flags)
+
+    def test_flags(self):
+        bgs, flags = _flag_unavailable_moes(self.bgs, self.moe.values())
+        assert flags == {
+            'POP_MOE': 'POP_MOE_UNAVAILABLE',
+            'INCOME_MOE': 'INCOME_MOE_UNAVAILABLE',
+        }
+        assert bgs['POP_MOE'].tolist() == [0, 4, 0]
+        assert bgs['POP_MOE_UNAVAILABLE'].tolist() == [0, 0, 1]
+        assert bgs['INCOME_MOE_UNAVAILABLE'].tolist() == [0, 1, 0]
+
+        # the original frame is left alone
+        assert self.bgs['POP_MOE'].tolist() == [-555555555, 4, -222222222]
+
+    def test_controlled_estimate(self):
+        # the first block group alone: a controlled estimate has no error
+        result = self.interpolate(gpd.GeoSeries([box(0, 0, 1, 1)]))
+        assert result['POP_MOE'].tolist() == [0]
+        assert result['INCOME_MOE'].tolist() == [3]
+
+    def test_unavailable(self):
+        targets = gpd.GeoSeries([
+            box(0, 0, 1, 1),      # first block group
+            box(0.5, 0, 1.5, 1),  # first and second
+            box(1.5, 0, 2.5, 1),  # second and third
+        ])
+        result = self.interpolate(targets)
+
+        # -222222222 (too few observations) in the third block group
+        assert not np.isnan(result['POP_MOE'].iloc[:2]).any()
+        assert np.isnan(result['POP_MOE'].iloc[2])
+
+        # -333333333 (open-ended median) in the second block group
+        assert not np.isnan(result['INCOME_MOE'].iloc[0])
+        assert np.isnan(result['INCOME_MOE'].iloc[1:]).all()
+
+        # estimates are not affected
+        assert not result[['POP', 'INCOME']].isnull().any(axis=None)
+
+    def test_flags_dropped(self):
+        result = self.interpolate(gpd.GeoSeries([box(0, 0, 3, 1)]))
+        assert not any(c.endswith('_UNAVAILABLE') for c in result.columns)
+        assert set(result.columns) == {
+            'POP', 'POP_MOE', 'INCOME', 'INCOME_MOE', 'geometry'}
@@ -8,10 +8,17 @@ import geopandas as gpd
 import numpy as np
 import pytest
 from pandas.util.testing import assert_frame_equal
-from shapely.geometry import Point, Polygon
+from shapely.geometry import Point, Polygon, box
 
 from cpe_help.util import crs
-from cpe_help.util.interpolation import weighted_areas
+from cpe_help.util.io import save_zipshp
+from cpe_help.util.interpolation import (
+    apply_weights,
+    areal_weights,
+    weighted_areas,
+    weighted_areas_from_files,
+    weighted_areas_many,
+)
 from cpe_help.util.testing import assert_geoframe_almost_equal
 
 
@@ -245,6 +252,400 @@ class TestWeightedAreas():
             fn(source, target)
 
 
+class TestWeightedAreasLoopEngine(TestWeightedAreas):
+    """
+    Same tests as TestWeightedAreas, with the brute-force engine
+    """
+
+    def setup_method(self):
+        super().setup_method()
+        self.interpolate = functools.partial(
+            weighted_areas,
+            ignore_crs=True,
+            engine='loop',
+        )
+
+
+class TestWeightedAreasStrictValidation(TestWeightedAreas):
+    """
+    Same tests as TestWeightedAreas, checking containment with unions
+    """
+
+    def setup_method(self):
+        super().setup_method()
+        self.interpolate = functools.partial(
+            weighted_areas,
+            ignore_crs=True,
+            validate='strict',
+        )
+
+    def test_wrong_validate(self):
+        source = self.source
+        target = self.target.geometry
+
+        with pytest.raises(ValueError):
+            weighted_areas(source, target, True, validate='maybe')
+
+
+class TestWeightedAreasEngines():
+    """
+    Tests for the agreement between the interpolation engines
+    """
+
+    def setup_method(self):
+        # 10x10 grid of unit squares as source
+        squares = [box(x, y, x + 1, y + 1)
+                   for x in range(10)
+                   for y in range(10)]
+        self.source = gpd.GeoDataFrame(
+            {'values': np.arange(100) % 7},
+            geometry=squares,
+        )
+
+        # 3x3 grid of shifted, bigger squares as target
+        squares = [box(x + 0.5, y + 0.5, x + 3.5, y + 3.5)
+                   for x in range(0, 9, 3)
+                   for y in range(0, 9, 3)]
+        self.target = gpd.GeoSeries(squares)
+
+    def test_same_result(self):
+        source = self.source
+        target = self.target
+
+        result1 = weighted_areas(source, target, True, engine='loop')
+        result2 = weighted_areas(source, target, True, engine='sindex')
+        assert_frame_equal(result1, result2)
+
+    def test_parallel(self):
+        source = self.source
+        target = self.target
+
+        result1 = weighted_areas(source, target, True)
+        result2 = weighted_areas(source, target, True, n_jobs=2)
+        assert_frame_equal(result1, result2)
+
+    def test_wrong_engine(self):
+        source = self.source
+        target = self.target
+
+        with pytest.raises(ValueError):
+            weighted_areas(source, target, True, engine='magic')
+
+
+class TestWeightedAreasMany():
+    """
+    Tests for interpolation into many targets at once
+    """
+
+    def setup_method(self):
+        sq1 = Polygon([(0, 0), (0, 2), (2, 2), (2, 0)])
+        sq2 = Polygon([(2, 0), (2, 2), (4, 2), (4, 0)])
+        self.source = gpd.GeoDataFrame({'values': [1, 2]},
+                                       geometry=[sq1, sq2])
+
+        sq1 = Polygon([(0, 0), (0, 2), (1, 2), (1, 0)])
+        sq2 = Polygon([(1, 0), (1, 2), (3, 2), (3, 0)])
+        sq3 = Polygon([(3, 0), (3, 2), (4, 2), (4, 0)])
+        self.target1 = gpd.GeoSeries([sq1, sq2, sq3])
+        self.target2 = gpd.GeoSeries([sq2], index=['a'])
+
+    def test_same_as_single(self):
+        source = self.source
+        targets = [self.target1, self.target2]
+
+        results = weighted_areas_many(source, targets, ignore_crs=True)
+
+        assert len(results) == 2
+        for result, target in zip(results, targets):
+            expected = weighted_areas(source, target, ignore_crs=True)
+            assert_frame_equal(result, expected)
+
+    def test_one_bad_target(self):
+        # every target must be contained by the source
+        source = self.source
+        outside = gpd.GeoSeries([Polygon([(5, 5), (5, 6), (6, 6)])])
+        targets = [self.target1, outside]
+
+        with pytest.raises(ValueError):
+            weighted_areas_many(source, targets, ignore_crs=True)
+
+
+class TestWeightedAreasKinds():
+    """
+    Tests for intensive variables and ratios
+    """
+
+    def setup_method(self):
+        sq1 = Polygon([(0, 0), (0, 2), (2, 2), (2, 0)])
+        sq2 = Polygon([(2, 0), (2, 2), (4, 2), (4, 0)])
+        self.source = gpd.GeoDataFrame(
+            {
+                'count': [1, 2],
+                'total': [4, 4],
+                'median': [10, 20],
+            },
+            geometry=[sq1, sq2],
+        )
+
+        sq1 = Polygon([(0, 0), (0, 2), (1, 2), (1, 0)])
+        sq2 = Polygon([(1, 0), (1, 2), (4, 2), (4, 0)])
+        self.target = gpd.GeoSeries([sq1, sq2])
+
+        self.interpolate = functools.partial(weighted_areas, ignore_crs=True)
+
+    def test_intensive(self):
+        source = self.source
+        target = self.target
+        fn = self.interpolate
+
+        result = fn(source, target, intensive=['median'])
+        expected = gpd.GeoDataFrame(
+            {
+                'count': [0.5, 2.5],
+                'total': [2.0, 6.0],
+                'median': [10.0, (10 * 2 + 20 * 4) / 6],
+            },
+            geometry=target,
+        )
+        assert_frame_equal(result, expected)
+
+    def test_ratios(self):
+        source = self.source
+        target = self.target
+        fn = self.interpolate
+
+        source['total'] = [4, 0]
+        result = fn(source, target, ratios={'rate': ('count', 'total')})
+        expected = gpd.GeoDataFrame(
+            {
+                'count': [0.5, 2.5],
+                'total': [2.0, 2.0],
+                'median': [5.0, 25.0],
+                'rate': [0.25, 1.25],
+            },
+            geometry=target,
+        )
+        assert_frame_equal(result, expected)
+
+    def test_ratio_zero_denominator(self):
+        source = self.source
+        target = self.target
+        fn = self.interpolate
+
+        source['total'] = [0, 4]
+        result = fn(source, target, ratios={'rate': ('count', 'total')})
+        assert np.isnan(result.loc[0, 'rate'])
+
+    def test_moe(self):
+        source = self.source
+        target = self.target
+        fn = self.interpolate
+
+        source['count_moe'] = [3, 4]
+        source['median_moe'] = [6, 8]
+        result = fn(
+            source,
+            target,
+            intensive=['median'],
+            moe={'count': 'count_moe', 'median': 'median_moe'},
+        )
+
+        # count_moe (extensive) weights are 1/2 and (1/2, 1)
+        # median_moe (intensive) weights are 1 and (1/3, 2/3)
+        np.testing.assert_allclose(
+            result['count_moe'],
+            [1.5, np.sqrt(1.5 ** 2 + 4 ** 2)],
+        )
+        np.testing.assert_allclose(
+            result['median_moe'],
+            [6, np.sqrt((6 / 3) ** 2 + (8 * 2 / 3) ** 2)],
+        )
+
+        # estimates are not affected
+        expected = fn(source.drop(['count_moe', 'median_moe'], axis=1),
+                      target, intensive=['median'])
+        assert_frame_equal(
+            result.drop(['count_moe', 'median_moe'], axis=1),
+            expected,
+        )
+
+    def test_unknown_column(self):
+        source = self.source
+        target = self.target
+        fn = self.interpolate
+
+        with pytest.raises(ValueError):
+            fn(source, target, intensive=['nothing'])
+        with pytest.raises(ValueError):
+            fn(source, target, ratios={'rate': ('count', 'nothing')})
+
+    def test_intensive_weights(self):
+        source = self.source
+        target = self.target
+
+        weights = areal_weights(source, target, ignore_crs=True,
+                                kind='intensive')
+        result = apply_weights(weights, source[['median']])
+        expected = weighted_areas(source, target, ignore_crs=True,
+                                  intensive=['median'])
+        np.testing.assert_allclose(result['median'], expected['median'])
+
+
+class TestWeightedAreasFromFiles():
+    """
+    Tests for the tiled interpolation, reading the source from files
+    """
+
+    def setup_method(self):
+        # 10x10 grid of unit squares as source, in two files
+        squares = [box(x, y, x + 1, y + 1)
+                   for x in range(10)
+                   for y in range(10)]
+        self.source = gpd.GeoDataFrame(
+            {'values': np.arange(100) % 7, 'density': np.arange(100.)},
+            geometry=squares,
+        )
+
+        # 3x3 grid of shifted, bigger squares as target
+        squares = [box(x + 0.5, y + 0.5, x + 3.5, y + 3.5)
+                   for x in range(0, 9, 3)
+                   for y in range(0, 9, 3)]
+        self.target = gpd.GeoSeries(squares)
+
+    def test_same_result(self, tmpdir):
+        paths = [str(tmpdir / 'left.zip'), str(tmpdir / 'right.zip')]
+        save_zipshp(self.source.iloc[:50], paths[0])
+        save_zipshp(self.source.iloc[50:], paths[1])
+
+        expected = weighted_areas(self.source, self.target, ignore_crs=True,
+                                  intensive=['density'])
+        for n_tiles in [1, 3, 12]:
+            result = weighted_areas_from_files(paths, self.target,
+                                               n_tiles=n_tiles,
+                                               ignore_crs=True,
+                                               intensive=['density'])
+            assert_geoframe_almost_equal(result, expected)
+
+    def test_single_path(self, tmpdir):
+        path = str(tmpdir / 'source.zip')
+        save_zipshp(self.source, path)
+
+        expected = weighted_areas(self.source, self.target, ignore_crs=True)
+        result = weighted_areas_from_files(path, self.target, n_tiles=4,
+                                           ignore_crs=True)
+        assert_geoframe_almost_equal(result, expected)
+
+    def test_values(self, tmpdir):
+        # the files only have the keys, values come from elsewhere
+        path = str(tmpdir / 'source.zip')
+        geoids = [f'{i:03d}' for i in range(100)]
+        shapes = gpd.GeoDataFrame({'GEOID': geoids},
+                                  geometry=self.source.geometry)
+        save_zipshp(shapes, path)
+        values = self.source.drop('geometry', axis=1)
+        values.index = geoids
+        # in another order, and with a non-numeric column
+        values = values.iloc[::-1].assign(NAME='name')
+
+        expected = weighted_areas(self.source, self.target, ignore_crs=True,
+                                  intensive=['density'])
+        result = weighted_areas_from_files(path, self.target, n_tiles=4,
+                                           ignore_crs=True,
+                                           intensive=['density'],
+                                           values=values)
+        assert_geoframe_almost_equal(result, expected)
+
+        # every source shape must have values
+        with pytest.raises(ValueError):
+            weighted_areas_from_files(path, self.target, ignore_crs=True,
+                                      values=values.iloc[1:])
+        with pytest.raises(ValueError):
+            weighted_areas_from_files(path, self.target, ignore_crs=True,
+                                      values=values, key='NOTHING')
+
+
+class TestArealWeights():
+    """
+    Tests for the reusable interpolation weights
+    """
+
+    def setup_method(self):
+        sq1 = Polygon([(0, 0), (0, 2), (2, 2), (2, 0)])
+        sq2 = Polygon([(2, 0), (2, 2), (4, 2), (4, 0)])
+        sq3 = Polygon([(9, 9), (9, 10), (10, 10), (10, 9)])  # far away
+        self.source = gpd.GeoDataFrame(geometry=[sq1, sq2, sq3])
+
+        sq1 = Polygon([(0, 0), (0, 2), (1, 2), (1, 0)])
+        sq2 = Polygon([(1, 0), (1, 2), (3, 2), (3, 0)])
+        sq3 = Polygon([(3, 0), (3, 2), (4, 2), (4, 0)])
+        self.target = gpd.GeoSeries([sq1, sq2, sq3])
+
+    def test_weights(self):
+        weights = areal_weights(self.source, self.target, ignore_crs=True)
+
+        assert weights.shape == (3, 3)
+        expected = np.array([
+            [0.5, 0, 0],
+            [0.5, 0.5, 0],
+            [0, 0.5, 0],
+        ])
+        np.testing.assert_allclose(weights.toarray(), expected)
+
+    def test_apply(self):
+        source = self.source
+        target = self.target
+
+        source['values1'] = [1, 2, 100]
+        source['values2'] = [0, 1, 100]
+        weights = areal_weights(source, target, ignore_crs=True)
+        result = apply_weights(weights, source, index=target.index)
+
+        expected = weighted_areas(source, target, ignore_crs=True)
+        expected = expected.drop('geometry', axis=1)
+        assert_frame_equal(result, expected)
+
+    def test_cache(self, tmpdir):
+        source = self.source
+        target = self.target
+        fn = functools.partial(areal_weights, ignore_crs=True)
+
+        weights1 = fn(source, target, cache_dir=str(tmpdir))
+        assert len(tmpdir.listdir()) == 1
+        # no temporary file is left behind
+        assert tmpdir.listdir()[0].ext == '.npz'
+
+        weights2 = fn(source, target, cache_dir=str(tmpdir))
+        assert len(tmpdir.listdir()) == 1
+        np.testing.assert_array_equal(weights1.toarray(), weights2.toarray())
+
+        # different geometries, different entry
+        fn(source.iloc[:2], target, cache_dir=str(tmpdir))
+        assert len(tmpdir.listdir()) == 2
+
+    def test_cache_ignores_values(self, tmpdir):
+        source = self.source
+        target = self.target
+        fn = functools.partial(weighted_areas, ignore_crs=True)
+
+        source['values'] = [1, 2, 100]
+        fn(source, target, cache_dir=str(tmpdir))
+        source['values'] = [2, 4, 200]
+        result = fn(source, target, cache_dir=str(tmpdir))
+        assert len(tmpdir.listdir()) == 1
+
+        expected = fn(source, target)
+        assert_frame_equal(result, expected)
+
+    def test_apply_wrong_shape(self):
+        source = self.source
+        target = self.target
+
+        weights = areal_weights(source, target, ignore_crs=True)
+        values = source.iloc[:2].assign(values=[1, 2])
+        with pytest.raises(ValueError):
+            apply_weights(weights, values)
+
+
 class TestWeightedAreasNoIgnoreCRS():
     """
     Tests for weighted areal interpolation when ignore_crs=False
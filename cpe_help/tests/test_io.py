@@ -6,10 +6,12 @@ from tempfile import NamedTemporaryFile
 
 import geopandas as gpd
 import pandas as pd
+import pyarrow.parquet
 from pandas.util.testing import assert_frame_equal
 from shapely.geometry import Point
 
-from cpe_help.util import io
+from cpe_help.util import crs, io
+from cpe_help.util.testing import assert_geoframe_almost_equal
 
 
 def test_save_geojson_with_bool():
@@ -49,3 +51,105 @@ def test_save_geojson_with_datetime():
     value = result.iloc[0, 0]
     assert isinstance(value, str)
     assert '2015' in value
+
+
+def test_geoparquet_roundtrip(tmpdir):
+    df = gpd.GeoDataFrame(
+        {'GEOID': ['01001', '01003'], 'ALAND': [10, 20]},
+        geometry=[Point(0, 0).buffer(1), Point(5, 5).buffer(2)],
+        crs=crs.EPSG4269,
+    )
+    path = str(tmpdir / 'df.parquet')
+    io.save_geoparquet(df, path)
+    result = io.load_geoparquet(path)
+
+    assert_geoframe_almost_equal(result, df)
+    assert_frame_equal(result.drop('geometry', axis=1),
+                       df.drop('geometry', axis=1))
+    assert result.crs == df.crs
+
+    result = io.load_geoparquet(path, columns=['GEOID'])
+    assert list(result.columns) == ['GEOID', 'geometry']
+
+
+def test_geoparquet_filters(tmpdir):
+    df = gpd.GeoDataFrame(
+        {'STATEFP': ['01', '01', '02'], 'COUNTYFP': ['001', '003', '001']},
+        geometry=[Point(0, 0), Point(5, 5), Point(10, 10)],
+    )
+    path = str(tmpdir / 'df.parquet')
+    io.save_geoparquet(df, path)
+
+    result = io.load_geoparquet(path, where={'STATEFP': ['01']})
+    assert result['COUNTYFP'].tolist() == ['001', '003']
+
+    result = io.load_geoparquet(path, where={'STATEFP': ['01'],
+                                             'COUNTYFP': ['003', '005']})
+    assert result['COUNTYFP'].tolist() == ['003']
+
+    result = io.load_geoparquet(path, bbox=(4, 4, 20, 20))
+    assert result['STATEFP'].tolist() == ['01', '02']
+
+    result = io.load_geoparquet(path, columns=['COUNTYFP'],
+                                where={'STATEFP': ['02']},
+                                bbox=(0, 0, 20, 20))
+    assert list(result.columns) == ['COUNTYFP', 'geometry']
+    assert result['COUNTYFP'].tolist() == ['001']
+    assert list(result.index) == [0]
+
+
+def test_geoparquet_index(tmpdir):
+    df = gpd.GeoDataFrame(
+        {'COUNTYFP': ['001', '003', '005', '007']},
+        geometry=[Point(0, 0), Point(5, 5).buffer(1), None, Point(10, 10)],
+    )
+    path = str(tmpdir / 'df.parquet')
+    index_path = str(tmpdir / 'df.rtree')
+    io.save_geoparquet(df, path)
+    io.save_geoparquet_index(path, index_path)
+
+    rows = io.query_geoparquet_index(index_path, (3, 3, 20, 20))
+    assert rows == [1, 3]
+    result = io.load_geoparquet(path, rows=rows)
+    assert result['COUNTYFP'].tolist() == ['003', '007']
+
+    assert io.query_geoparquet_index(index_path, (1, 1, 2, 2)) == []
+
+
+def test_geoparquet_row_groups(tmpdir, monkeypatch):
+    df = gpd.GeoDataFrame(
+        {'COUNTYFP': [f'{i:03d}' for i in range(10)]},
+        geometry=[Point(i, i) for i in range(10)],
+    )
+    path = str(tmpdir / 'df.parquet')
+    io.save_geoparquet(df, path, row_group_size=3)
+
+    read = []
+    read_row_group = pyarrow.parquet.ParquetFile.read_row_group
+
+    def spy(self, i, **kwargs):
+        read.append(i)
+        return read_row_group(self, i, **kwargs)
+
+    monkeypatch.setattr(pyarrow.parquet.ParquetFile, 'read_row_group', spy)
+
+    result = io.load_geoparquet(path, rows=[1, 7, 8])
+    assert result['COUNTYFP'].tolist() == ['001', '007', '008']
+    assert read == [0, 2]
+
+    result = io.load_geoparquet(path, where={'COUNTYFP': ['008']},
+                                rows=[1, 7, 8])
+    assert result['COUNTYFP'].tolist() == ['008']
+
+    assert len(io.load_geoparquet(path, rows=[])) == 0
+    assert len(io.load_geoparquet(path)) == 10
+
+
+def test_geoparquet_index_empty(tmpdir):
+    df = gpd.GeoDataFrame({'COUNTYFP': []}, geometry=[])
+    path = str(tmpdir / 'df.parquet')
+    index_path = str(tmpdir / 'df.rtree')
+    io.save_geoparquet(df, path)
+    io.save_geoparquet_index(path, index_path)
+
+    assert io.query_geoparquet_index(index_path, (0, 0, 1, 1)) == []
@@ -0,0 +1,131 @@
+"""
+Module for testing the ACS class against a local stand-in server
+"""
+
+import pathlib
+import time
+
+import pytest
+import requests
+from pandas.util.testing import assert_frame_equal
+
+from cpe_help import ACS
+from cpe_help import acs as acs_module
+from cpe_help.acs import _configured_variables
+from cpe_help.mock_census import MockCensusServer, SyntheticCensus
+
+
+VARIABLES = ['NAME'] + [f'B01001_{i:03d}E' for i in range(1, 61)]
+
+
+def make_acs(server, **kwargs):
+    kwargs.setdefault('cache_size', 0)
+    kwargs.setdefault('rate', 0)
+    return ACS(base_url=server.url, **kwargs)
+
+
+def test_same_as_fixture():
+    fixture = SyntheticCensus(n_counties=2)
+    with MockCensusServer(fixture) as server:
+        acs = make_acs(server)
+        result = acs._query(VARIABLES[:3], 'tract', 'state:01 county:003')
+
+    expected = fixture._query(VARIABLES[:3], 'tract', 'state:01 county:003')
+    assert result == expected
+    assert len(result) == 1 + fixture.n_tracts
+
+
+def test_bad_request():
+    with MockCensusServer() as server:
+        acs = make_acs(server, max_retries=0)
+        with pytest.raises(requests.HTTPError):
+            acs._query(VARIABLES[:3], 'nation')
+
+
+def test_retries():
+    fixture = SyntheticCensus()
+    insides = [f'state:01 county:{c}' for c in ['001', '003', '005']]
+    with MockCensusServer(fixture, error_rate=0.5) as server:
+        acs = make_acs(server, max_retries=10)
+        result = acs.data_many(VARIABLES, 'block group', insides)
+        assert server.error_count > 0
+
+    with MockCensusServer(fixture) as server:
+        acs = make_acs(server)
+        expected = acs.data_many(VARIABLES, 'block group', insides)
+
+    assert_frame_equal(result, expected)
+
+
+def test_concurrency():
+    # 3 counties x 2 chunks of variables = 6 requests
+    insides = [f'state:01 county:{c}' for c in ['001', '003', '005']]
+
+    elapsed = {}
+    for max_workers in [1, 6]:
+        with MockCensusServer(latency=0.1) as server:
+            acs = make_acs(server, max_workers=max_workers)
+            start = time.monotonic()
+            acs.data_many(VARIABLES, 'tract', insides)
+            elapsed[max_workers] = time.monotonic() - start
+            assert server.request_count == 6
+
+    assert elapsed[1] >= 0.6
+    assert elapsed[6] < elapsed[1] / 2
+
+
+def test_cache(tmpdir):
+    with MockCensusServer() as server:
+        acs = make_acs(server, cache_dir=str(tmpdir), cache_size=1)
+        result1 = acs.data(VARIABLES, 'county', 'state:01')
+        result2 = acs.data(VARIABLES, 'county', 'state:01')
+        assert server.request_count == 2
+
+    assert_frame_equal(result1, result2)
+
+
+def test_data_batch():
+    fixture = SyntheticCensus()
+    insides = [f'state:01 county:{c}' for c in ['001', '003']]
+    batch = [
+        (VARIABLES, 'tract', insides),
+        (VARIABLES[:10], 'tract', insides[:1]),
+        ({'B01001_001E': 'TOTAL'}, 'block group', insides),
+    ]
+
+    with MockCensusServer(fixture) as server:
+        acs = make_acs(server)
+        results = acs.data_batch(batch)
+        # tract: 2 areas x 2 chunks, block group: 2 areas x 1 chunk
+        assert server.request_count == 6
+
+        for request, result in zip(batch, results):
+            expected = acs.data_many(*request)
+            assert_frame_equal(result, expected)
+
+
+def test_download_values(tmpdir, monkeypatch):
+    monkeypatch.setattr(ACS, 'path', pathlib.Path(str(tmpdir)))
+    fixture = SyntheticCensus(n_counties=2, n_tracts=3, n_block_groups=2)
+
+    with MockCensusServer(fixture) as server:
+        acs = make_acs(server)
+        acs.create_directories()
+        acs.download_values('01')
+
+    tracts = acs.load_tract_values('01')
+    bgs = acs.load_bg_values('01')
+    assert tracts.shape[0] == 2 * 3
+    assert bgs.shape[0] == 2 * 3 * 2
+    assert bgs['county'].unique().tolist() == ['001', '003']
+    assert tracts.shape[1] == len(_configured_variables()) + 3
+    assert bgs.shape[1] == len(_configured_variables()) + 4
+
+
+def test_timeout(monkeypatch):
+    monkeypatch.setattr(acs_module, '_BACKOFF', 0)
+    with MockCensusServer(latency=0.5) as server:
+        acs = make_acs(server, timeout=0.1, max_retries=1)
+        with pytest.raises(requests.Timeout):
+            acs._query(VARIABLES[:3], 'county', 'state:01')
+        assert server.request_count == 2
@@ -0,0 +1,221 @@
+"""
+Module for testing downloads, against a local server
+"""
+
+import gzip
+import hashlib
+import http.server
+import io
+import pathlib
+import re
+import threading
+import zipfile
+
+import pytest
+import requests
+
+from cpe_help.util import network
+
+
+def make_zip(size=100000):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('data.txt', bytes(range(256)) * (size // 256))
+    return buffer.getvalue()
+
+
+class FileServer(object):
+    """
+    I will serve files over HTTP, honoring range requests
+
+    If cut is set, the first response breaks after cut bytes. If gzip
+    is set, files are compressed for the clients that accept it.
+    """
+    def __init__(self, files, cut=None, gzip=False):
+        self.files = files
+        self.cut = cut
+        self.gzip = gzip
+        self.ranges = []
+
+    def __enter__(self):
+        handler = type('Handler', (_Handler,), {'server_': self})
+        self._server = http.server.HTTPServer(('127.0.0.1', 0), handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            kwargs={'poll_interval': 0.05},
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def url(self, name):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}/{name}'
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_ = None
+
+    def do_GET(self):
+        data = self.server_.files.get(self.path.lstrip('/'))
+        if data is None:
+            self.send_error(404)
+            return
+        range_ = self.headers.get('Range')
+        self.server_.ranges.append(range_)
+
+        encoding = None
+        if (self.server_.gzip and
+                'gzip' in self.headers.get('Accept-Encoding', '')):
+            # as a server compressing on the fly, ignoring ranges
+            data = gzip.compress(data)
+            encoding = 'gzip'
+            range_ = None
+
+        start = 0
+        if range_ is not None:
+            start = int(re.match(r'bytes=(\d+)-', range_)[1])
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(data) - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+
+        body = data[start:]
+        if self.server_.cut is not None:
+            body = body[:self.server_.cut]
+            self.server_.cut = None
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(network, '_BACKOFF', 0)
+
+
+def test_download(tmpdir):
+    data = make_zip()
+    out = pathlib.Path(str(tmpdir)) / 'file.zip'
+    with FileServer({'file.zip': data}) as server:
+        network.download(server.url('file.zip'), out)
+
+    assert out.read_bytes() == data
+    assert not out.with_name('file.zip.part').exists()
+
+
+def test_resume(tmpdir):
+    data = make_zip()
+    out = pathlib.Path(str(tmpdir)) / 'file.zip'
+    out.with_name('file.zip.part').write_bytes(data[:1000])
+
+    with FileServer({'file.zip': data}) as server:
+        network.download(server.url('file.zip'), out)
+        assert server.ranges == ['bytes=1000-']
+
+    assert out.read_bytes() == data
+
+
+def test_resume_after_interruption(tmpdir):
+    data = make_zip(500000)
+    out = pathlib.Path(str(tmpdir)) / 'file.zip'
+
+    with FileServer({'file.zip': data}, cut=300000) as server:
+        network.download(server.url('file.zip'), out)
+        # the second request resumes from what was received
+        assert len(server.ranges) == 2
+        assert server.ranges[0] is None
+        assert server.ranges[1] != 'bytes=0-'
+
+    assert out.read_bytes() == data
+
+
+def test_no_compression(tmpdir):
+    data = b'some text, ' * 10000
+    out = pathlib.Path(str(tmpdir)) / 'file.txt'
+    out.with_name('file.txt.part').write_bytes(data[:1000])
+
+    with FileServer({'file.txt': data}, gzip=True) as server:
+        network.download(server.url('file.txt'), out)
+        assert server.ranges == ['bytes=1000-']
+
+    assert out.read_bytes() == data
+
+
+def test_already_complete(tmpdir):
+    data = make_zip()
+    out = pathlib.Path(str(tmpdir)) / 'file.zip'
+    out.with_name('file.zip.part').write_bytes(data)
+
+    with FileServer({'file.zip': data}) as server:
+        network.download(server.url('file.zip'), out)
+
+    assert out.read_bytes() == data
+
+
+def test_corrupt_zip(tmpdir):
+    data = bytearray(make_zip())
+    # flip a byte of the (stored) member
+    data[100] ^= 0xFF
+    out = pathlib.Path(str(tmpdir)) / 'file.zip'
+    out.write_bytes(b'old')
+
+    with FileServer({'file.zip': bytes(data)}) as server:
+        with pytest.raises(ValueError):
+            network.download(server.url('file.zip'), out)
+
+    # the old file is kept, and the corrupt one is dropped
+    assert out.read_bytes() == b'old'
+    assert not out.with_name('file.zip.part').exists()
+
+
+def test_sha256(tmpdir):
+    data = b'some data'
+    out = pathlib.Path(str(tmpdir)) / 'file.txt'
+
+    with FileServer({'file.txt': data}) as server:
+        url = server.url('file.txt')
+        with pytest.raises(ValueError):
+            network.download(url, out, sha256='0' * 64)
+        network.download(url, out, sha256=hashlib.sha256(data).hexdigest())
+
+    assert out.read_bytes() == data
+
+
+def test_not_found(tmpdir):
+    out = pathlib.Path(str(tmpdir)) / 'file.zip'
+    with FileServer({}) as server:
+        with pytest.raises(requests.HTTPError):
+            network.download(server.url('file.zip'), out)
+    assert not out.exists()
+
+
+def test_download_many(tmpdir):
+    files = {f'{i}.zip': make_zip(1000 * (i + 1)) for i in range(5)}
+    tmpdir = pathlib.Path(str(tmpdir))
+
+    with FileServer(files) as server:
+        network.download_many(
+            [(server.url(name), tmpdir / name) for name in files],
+            max_workers=3,
+        )
+
+    for name, data in files.items():
+        assert (tmpdir / name).read_bytes() == data
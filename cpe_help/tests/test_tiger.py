@@ -0,0 +1,220 @@
+"""
+Module for testing the TIGER class
+"""
+
+import os
+import pathlib
+
+import geopandas as gpd
+from shapely.geometry import Point, box
+
+from cpe_help import TIGER, util
+from cpe_help.tiger import _frame_size, _FrameCache, _sort_by_space
+from cpe_help.util import crs
+from cpe_help.util.io import save_zipshp
+from cpe_help.util.testing import assert_geoframe_almost_equal
+
+
+class TestLoad():
+    """
+    Tests for loading (cached) boundaries
+    """
+
+    def setup_method(self):
+        self.counties = gpd.GeoDataFrame(
+            {'STATEFP': ['01', '01'], 'COUNTYFP': ['001', '003']},
+            geometry=[Point(0, 0).buffer(1), Point(5, 5).buffer(2)],
+            crs=crs.EPSG4269,
+        )
+
+    def make_tiger(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(TIGER, 'path', pathlib.Path(str(tmpdir)))
+        tiger = TIGER()
+        tiger.create_directories()
+        return tiger
+
+    def test_sidecar(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        save_zipshp(self.counties, tiger.county_boundaries_path)
+        sidecar = tiger.county_boundaries_path.with_suffix('.parquet')
+
+        result1 = tiger.load_county_boundaries()
+        assert sidecar.exists()
+        result2 = tiger.load_county_boundaries()
+
+        assert_geoframe_almost_equal(result1, self.counties)
+        assert_geoframe_almost_equal(result2, self.counties)
+        assert result2['COUNTYFP'].tolist() == ['001', '003']
+
+    def test_sidecar_outdated(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        path = tiger.county_boundaries_path
+        save_zipshp(self.counties, path)
+        tiger.load_county_boundaries()
+
+        # download again (with newer contents)
+        save_zipshp(self.counties.iloc[:1], path)
+        sidecar = path.with_suffix('.parquet')
+        mtime = sidecar.stat().st_mtime
+        os.utime(path, (mtime + 1, mtime + 1))
+
+        result = tiger.load_county_boundaries()
+        assert len(result) == 1
+        assert len(tiger.load_county_boundaries()) == 1
+
+    def test_filters(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        save_zipshp(self.counties, tiger.county_boundaries_path)
+
+        result = tiger.load_county_boundaries(states=['01'])
+        assert len(result) == 2
+        result = tiger.load_county_boundaries(states=['02'])
+        assert len(result) == 0
+
+        result = tiger.load_county_boundaries(bbox=(4, 4, 10, 10))
+        assert result['COUNTYFP'].tolist() == ['003']
+        result = tiger.load_county_boundaries(bbox=(1.5, 1.5, 2, 2))
+        assert len(result) == 0
+
+    def test_memory_cache(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        save_zipshp(self.counties, tiger.county_boundaries_path)
+
+        loads = []
+
+        def load_geoparquet(path, **kwargs):
+            loads.append(kwargs)
+            return load(path, **kwargs)
+
+        load = util.io.load_geoparquet
+        monkeypatch.setattr(util.io, 'load_geoparquet', load_geoparquet)
+
+        result1 = tiger.load_county_boundaries()
+        result2 = TIGER().load_county_boundaries()
+        assert len(loads) == 1
+        assert_geoframe_almost_equal(result1, result2)
+
+        # filters are part of the key
+        tiger.load_county_boundaries(states=['01'])
+        tiger.load_county_boundaries(states=['01'])
+        assert len(loads) == 2
+
+    def test_memory_cache_copies(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        save_zipshp(self.counties, tiger.county_boundaries_path)
+
+        result = tiger.load_county_boundaries()
+        columns = result.columns.tolist()
+        result['NEW'] = 1
+        result.loc[0, 'COUNTYFP'] = '999'
+        result.set_index('STATEFP', inplace=True)
+
+        result = tiger.load_county_boundaries()
+        assert result.columns.tolist() == columns
+        assert result['COUNTYFP'].tolist() == ['001', '003']
+
+    def test_intersects(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        save_zipshp(self.counties, tiger.county_boundaries_path)
+
+        # the bounding box of the first county touches the shape, but
+        # the county itself does not
+        shape = box(0.8, 0.8, 4, 4)
+        result = tiger.load_county_boundaries(intersects=shape)
+        assert result['COUNTYFP'].tolist() == ['003']
+        assert tiger.county_boundaries_path.with_suffix('.rtree.idx').exists()
+
+        result = tiger.load_county_boundaries(intersects=box(-1, -1, 6, 6))
+        assert result['COUNTYFP'].tolist() == ['001', '003']
+        result = tiger.load_county_boundaries(states=['02'],
+                                              intersects=shape)
+        assert len(result) == 0
+
+    def test_intersects_outdated(self, tmpdir, monkeypatch):
+        tiger = self.make_tiger(tmpdir, monkeypatch)
+        path = tiger.county_boundaries_path
+        save_zipshp(self.counties, path)
+        assert len(tiger.load_county_boundaries(intersects=Point(5, 5))) == 1
+
+        # download again (with the counties swapped)
+        save_zipshp(self.counties.iloc[::-1], path)
+        mtime = path.with_suffix('.rtree.idx').stat().st_mtime
+        os.utime(path, (mtime + 1, mtime + 1))
+
+        result = tiger.load_county_boundaries(intersects=Point(0, 0))
+        assert result['COUNTYFP'].tolist() == ['001']
+
+
+def test_sort_by_space():
+    df = gpd.GeoDataFrame(
+        {'NAME': ['ne', 'none', 'sw', 'se', 'nw']},
+        geometry=[Point(10, 10), None, Point(0, 0), Point(10, 0),
+                  Point(0, 10)],
+    )
+    result = _sort_by_space(df)
+    assert result['NAME'].tolist() == ['sw', 'se', 'nw', 'ne', 'none']
+    assert list(result.index) == list(range(5))
+
+
+def test_download_boundaries(tmpdir, monkeypatch):
+    monkeypatch.setattr(TIGER, 'path', pathlib.Path(str(tmpdir)))
+    tiger = TIGER(year=2016)
+    tiger.create_directories()
+    tiger.state_boundaries_path.touch()
+
+    downloads = []
+    monkeypatch.setattr(util.network, 'download_many', downloads.extend)
+    tiger.download_boundaries(['01', '02'])
+
+    urls = [url for url, _ in downloads]
+    assert len(urls) == 1 + 2 * 3
+    assert urls[0] == ('https://www2.census.gov/geo/tiger/TIGER2016/'
+                       'COUNTY/tl_2016_us_county.zip')
+    assert urls[1] == ('https://www2.census.gov/geo/tiger/TIGER2016/'
+                       'TRACT/tl_2016_01_tract.zip')
+    assert downloads[-1][1] == tiger.place_boundaries_path('02')
+
+
+class TestFrameCache():
+    """
+    Tests for the in-memory cache of frames
+    """
+
+    def setup_method(self):
+        self.df = gpd.GeoDataFrame(
+            {'COUNTYFP': ['001', '003']},
+            geometry=[Point(0, 0).buffer(1), Point(5, 5).buffer(2)],
+        )
+        self.size = _frame_size(self.df)
+
+    def test_eviction(self):
+        cache = _FrameCache(max_size=int(self.size * 2.5))
+        cache.put('a', self.df)
+        cache.put('b', self.df)
+        cache.get('a')
+        cache.put('c', self.df)
+
+        # 'b' was the least recently used
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.get('c') is not None
+        assert cache.size <= cache.max_size
+
+    def test_copies(self):
+        cache = _FrameCache(max_size=self.size * 2)
+        cache.put('a', self.df)
+        self.df.loc[0, 'COUNTYFP'] = '999'
+
+        result = cache.get('a')
+        assert result['COUNTYFP'].tolist() == ['001', '003']
+        assert result.crs == self.df.crs
+
+        result.loc[1, 'COUNTYFP'] = '999'
+        assert cache.get('a')['COUNTYFP'].tolist() == ['001', '003']
+
+    def test_too_big(self):
+        cache = _FrameCache(max_size=self.size - 1)
+        cache.put('a', self.df)
+        assert len(cache) == 0
+        assert cache.size == 0
@@ -9,6 +9,13 @@ Ref:
 https://www.census.gov/geo/maps-data/data/tiger.html
 """
 
+import collections
+import os
+import pathlib
+import threading
+
+import numpy
+
 from cpe_help import util
 
 
@@ -84,17 +91,15 @@ class TIGER():
         """
         Download state boundaries for the US
         """
-        url = (f'https://www2.census.gov/geo/tiger/TIGER{self.year}/'
-               f'STATE/tl_{self.year}_us_state.zip')
-        util.network.download(url, self.state_boundaries_path)
+        util.network.download(self._url('STATE', 'us'),
+                              self.state_boundaries_path)
 
     def download_county_boundaries(self):
         """
         Download county boundaries for the US
         """
-        url = (f'https://www2.census.gov/geo/tiger/TIGER{self.year}/'
-               f'COUNTY/tl_{self.year}_us_county.zip')
-        util.network.download(url, self.county_boundaries_path)
+        util.network.download(self._url('COUNTY', 'us'),
+                              self.county_boundaries_path)
 
     def download_tract_boundaries(self, state):
         """
@@ -105,9 +110,8 @@ class TIGER():
         state : str
             GEOID for the wanted state.
         """
-        url = (f'https://www2.census.gov/geo/tiger/TIGER{self.year}/'
-               f'TRACT/tl_{self.year}_{state}_tract.zip')
-        util.network.download(url, self.tract_boundaries_path(state))
+        util.network.download(self._url('TRACT', state),
+                              self.tract_boundaries_path(state))
 
     def download_bg_boundaries(self, state):
         """
@@ -118,41 +122,112 @@ class TIGER():
         state : str
             GEOID for the wanted state.
         """
-        url = (f'https://www2.census.gov/geo/tiger/TIGER{self.year}/'
-               f'BG/tl_{self.year}_{state}_bg.zip')
-        util.network.download(url, self.bg_boundaries_path(state))
+        util.network.download(self._url('BG', state),
+                              self.bg_boundaries_path(state))
 
     def download_place_boundaries(self, state):
         """
         Download place boundaries for the US
         """
-        url = (f'https://www2.census.gov/geo/tiger/TIGER{self.year}'
-               f'/PLACE/tl_{self.year}_{state}_place.zip')
-        util.network.download(url, self.place_boundaries_path(state))
+        util.network.download(self._url('PLACE', state),
+                              self.place_boundaries_path(state))
+
+    def download_boundaries(self, states=()):
+        """
+        Download the boundaries of the US and of the given states
+
+        Files are downloaded at the same time (see
+        util.network.download_many). Those already downloaded are
+        skipped.
+
+        Parameters
+        ----------
+        states : list of str
+            GEOIDs of the states whose tract, block group and place
+            boundaries are wanted.
+        """
+        downloads = [
+            (self._url('STATE', 'us'), self.state_boundaries_path),
+            (self._url('COUNTY', 'us'), self.county_boundaries_path),
+        ]
+        for state in states:
+            downloads += [
+                (self._url('TRACT', state),
+                 self.tract_boundaries_path(state)),
+                (self._url('BG', state), self.bg_boundaries_path(state)),
+                (self._url('PLACE', state),
+                 self.place_boundaries_path(state)),
+            ]
+        downloads = [(url, path) for url, path in downloads
+                     if not path.exists()]
+        util.network.download_many(downloads)
+
+    def _url(self, layer, area):
+        """
+        Return the URL of a TIGER file
+
+        Parameters
+        ----------
+        layer : str
+            Name of the layer (e.g. 'TRACT').
+        area : str
+            'us' or the GEOID of a state.
+        """
+        return (f'https://www2.census.gov/geo/tiger/TIGER{self.year}/'
+                f'{layer}/tl_{self.year}_{area}_{layer.lower()}.zip')
 
     # input/output
 
-    def load_state_boundaries(self):
+    def load_state_boundaries(self, bbox=None, intersects=None):
         """
         Load state boundaries for the US
 
+        Parameters
+        ----------
+        bbox : tuple of float, optional
+            (minx, miny, maxx, maxy), in the CRS of the TIGER files
+            (NAD83). If given, only the states whose bounding boxes
+            intersect this box are loaded.
+        intersects : shapely.geometry.base.BaseGeometry, optional
+            Shape in the CRS of the TIGER files. If given, only the
+            states intersecting this shape are loaded. Candidates are
+            looked up in a spatial index kept next to the file, so
+            only their shapes are decoded and tested.
+
         Returns
         -------
         geopandas.GeoDataFrame
         """
-        return util.io.load_zipshp(self.state_boundaries_path)
+        return self._load(self.state_boundaries_path, bbox=bbox,
+                          intersects=intersects)
 
-    def load_county_boundaries(self):
+    def load_county_boundaries(self, states=None, bbox=None,
+                               intersects=None):
         """
         Load county boundaries for the US
 
+        Parameters
+        ----------
+        states : list of str, optional
+            If given, only the counties in these states (GEOIDs) are
+            loaded.
+        bbox : tuple of float, optional
+            See load_state_boundaries.
+        intersects : shapely.geometry.base.BaseGeometry, optional
+            See load_state_boundaries.
+
         Returns
         -------
         geopandas.GeoDataFrame
         """
-        return util.io.load_zipshp(self.county_boundaries_path)
-
-    def load_tract_boundaries(self, state):
+        where = {}
+        if states is not None:
+            where['STATEFP'] = states
+        return self._load(self.county_boundaries_path, where, bbox,
+                          intersects)
+
+    def load_tract_boundaries(self, state, counties=None, bbox=None,
+                              intersects=None):
         """
         Load tract boundaries for a given state
 
@@ -160,14 +235,26 @@ class TIGER():
         ----------
         state : str
             GEOID representing the state.
+        counties : list of str, optional
+            If given, only the tracts in these counties (county FIPS
+            codes, e.g. '001') are loaded.
+        bbox : tuple of float, optional
+            See load_state_boundaries.
+        intersects : shapely.geometry.base.BaseGeometry, optional
+            See load_state_boundaries.
 
         Returns
         -------
         geopandas.GeoDataFrame
         """
-        return util.io.load_zipshp(self.tract_boundaries_path(state))
-
-    def load_bg_boundaries(self, state):
+        where = {}
+        if counties is not None:
+            where['COUNTYFP'] = counties
+        path = self.tract_boundaries_path(state)
+        return self._load(path, where, bbox, intersects)
+
+    def load_bg_boundaries(self, state, counties=None, bbox=None,
+                           intersects=None):
         """
         Load block group boundaries for a given state
 
@@ -175,14 +262,26 @@ class TIGER():
         ----------
         state : str
             GEOID representing the state.
+        counties : list of str, optional
+            If given, only the block groups in these counties (county
+            FIPS codes, e.g. '001') are loaded.
+        bbox : tuple of float, optional
+            See load_state_boundaries.
+        intersects : shapely.geometry.base.BaseGeometry, optional
+            See load_state_boundaries.
 
         Returns
         -------
         geopandas.GeoDataFrame
         """
-        return util.io.load_zipshp(self.bg_boundaries_path(state))
-
-    def load_place_boundaries(self, state):
+        where = {}
+        if counties is not None:
+            where['COUNTYFP'] = counties
+        path = self.bg_boundaries_path(state)
+        return self._load(path, where, bbox, intersects)
+
+    def load_place_boundaries(self, state, funcstat=None, bbox=None,
+                              intersects=None):
         """
         Load place boundaries for a given state
 
@@ -192,9 +291,295 @@ class TIGER():
         ----------
         state : str
             GEOID representing the state.
+        funcstat : list of str, optional
+            If given, only the places with these functional statuses
+            are loaded (e.g. ['A'] for active governments).
+
+            https://www.census.gov/geo/reference/funcstat.html
+        bbox : tuple of float, optional
+            See load_state_boundaries.
+        intersects : shapely.geometry.base.BaseGeometry, optional
+            See load_state_boundaries.
 
         Returns
         -------
         geopandas.GeoDataFrame
         """
-        return util.io.load_zipshp(self.place_boundaries_path(state))
+        where = {}
+        if funcstat is not None:
+            where['FUNCSTAT'] = funcstat
+        path = self.place_boundaries_path(state)
+        return self._load(path, where, bbox, intersects)
+
+    def _load(self, path, where=None, bbox=None, intersects=None):
+        """
+        Load a downloaded zipped shapefile, through its Parquet sidecar
+
+        The first time a file is loaded (or after it is downloaded
+        again), it is converted into a Parquet file by its side, which
+        is much faster to load than the shapefile. Rows are filtered
+        while reading the sidecar (see util.io.load_geoparquet).
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            Path to the zipped shapefile.
+        where : dict, optional
+            Mapping of columns to lists of accepted values.
+        bbox : tuple of float, optional
+            (minx, miny, maxx, maxy), in the file's CRS.
+        intersects : shapely.geometry.base.BaseGeometry, optional
+            Shape in the file's CRS. If given, only the shapes
+            intersecting it are loaded (see _load_intersecting).
+
+        Returns
+        -------
+        geopandas.GeoDataFrame
+        """
+        if intersects is not None:
+            return self._load_intersecting(path, where, bbox, intersects)
+
+        # frames are reused while the file is not downloaded again
+        key = (
+            str(path),
+            path.stat().st_mtime_ns,
+            tuple(sorted((name, tuple(values))
+                         for name, values in (where or {}).items())),
+            tuple(bbox) if bbox is not None else None,
+        )
+        cache = _get_cache()
+        df = cache.get(key)
+        if df is not None:
+            return df
+
+        sidecar = self._update_sidecar(path)
+        df = util.io.load_geoparquet(sidecar, where=where, bbox=bbox)
+        cache.put(key, df)
+        return df
+
+    def _load_intersecting(self, path, where, bbox, intersects):
+        """
+        Load the shapes of a zipped shapefile intersecting a given shape
+
+        Candidates are looked up in a packed R-tree kept next to the
+        sidecar. Only the row groups of the sidecar holding them are
+        read (the sidecar is sorted in space), and only the candidates
+        are decoded and tested against the shape. The results are not
+        kept in memory, since queries rarely repeat.
+
+        Parameters
+        ----------
+        See _load.
+
+        Returns
+        -------
+        geopandas.GeoDataFrame
+        """
+        sidecar = self._update_sidecar(path)
+        index_path = path.with_suffix('.rtree')
+        try:
+            outdated = (pathlib.Path(f'{index_path}.idx').stat().st_mtime
+                        < sidecar.stat().st_mtime)
+        except FileNotFoundError:
+            outdated = True
+
+        if outdated:
+            _save_index(sidecar, index_path)
+
+        rows = util.io.query_geoparquet_index(index_path, intersects.bounds)
+        df = util.io.load_geoparquet(sidecar, where=where, bbox=bbox,
+                                     rows=rows)
+        df = df[df.intersects(intersects)]
+        return df.reset_index(drop=True)
+
+    def _update_sidecar(self, path):
+        """
+        Make sure the Parquet sidecar of a zipped shapefile is up to date
+
+        Parameters
+        ----------
+        path : pathlib.Path
+            Path to the zipped shapefile.
+
+        Returns
+        -------
+        pathlib.Path
+            Path to the sidecar.
+        """
+        sidecar = path.with_suffix('.parquet')
+        try:
+            outdated = sidecar.stat().st_mtime < path.stat().st_mtime
+        except FileNotFoundError:
+            outdated = True
+
+        if outdated:
+            df = util.io.load_zipshp(path)
+            # shapes close in space go to the same row groups, so that
+            # _load_intersecting reads only a few of them
+            df = _sort_by_space(df)
+
+            # write atomically, so a concurrent load never reads half a
+            # file
+            tmp_sidecar = sidecar.with_suffix(f'.{os.getpid()}.tmp')
+            util.io.save_geoparquet(df, tmp_sidecar,
+                                    row_group_size=_ROW_GROUP_SIZE)
+            os.replace(tmp_sidecar, sidecar)
+            _save_index(sidecar, path.with_suffix('.rtree'))
+
+        return sidecar
+
+
+def _save_index(sidecar, index_path):
+    """
+    Save the spatial index of a sidecar, replacing the old one
+
+    See util.io.save_geoparquet_index.
+    """
+    tmp_path = index_path.with_suffix(f'.{os.getpid()}.tmp')
+    util.io.save_geoparquet_index(sidecar, tmp_path)
+    # the .idx file goes last, since its age tells if the index is
+    # outdated
+    for ext in ['.dat', '.idx']:
+        os.replace(f'{tmp_path}{ext}', f'{index_path}{ext}')
+
+
+class _FrameCache(object):
+    """
+    I will keep recently loaded frames in memory, up to a total size
+
+    I keep my own copy of each frame, and hand out copies of it, so
+    that whoever modifies a frame does not change it for everyone else.
+    Copies are cheap: only the columns' arrays are copied, and the
+    shapes in them are shared. When the total (estimated) size goes
+    above max_size, the least recently used frames are dropped.
+    """
+    def __init__(self, max_size):
+        """
+        Initialize a new (empty) cache
+
+        Parameters
+        ----------
+        max_size : int
+            Maximum total size of the frames, in bytes.
+        """
+        self.max_size = max_size
+        self.size = 0
+        self._frames = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        """
+        Return (a copy of) the frame for key, or None if not cached
+        """
+        with self._lock:
+            if key not in self._frames:
+                return None
+            self._frames.move_to_end(key)
+            df = self._frames[key][0]
+        return df.copy()
+
+    def put(self, key, df):
+        """
+        Keep (a copy of) the frame for key, evicting old frames if needed
+        """
+        size = _frame_size(df)
+        with self._lock:
+            if key in self._frames:
+                self.size -= self._frames.pop(key)[1]
+            if size > self.max_size:
+                return
+            self._frames[key] = (df.copy(), size)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, old_size) = self._frames.popitem(last=False)
+                self.size -= old_size
+
+    def clear(self):
+        """
+        Drop all frames
+        """
+        with self._lock:
+            self._frames.clear()
+            self.size = 0
+
+
+def _sort_by_space(df):
+    """
+    Sort the rows of a GeoDataFrame along a Z-order curve
+
+    The curve goes through the centers of the shapes' bounding boxes,
+    so shapes close in space are mostly close in the result too. Rows
+    without a shape go last.
+    """
+    bounds = df.geometry.bounds
+    x = ((bounds['minx'] + bounds['maxx']) / 2).values
+    y = ((bounds['miny'] + bounds['maxy']) / 2).values
+    valid = numpy.isfinite(x) & numpy.isfinite(y)
+    if not valid.any():
+        return df
+
+    key = numpy.full(len(df), numpy.iinfo(numpy.uint64).max,
+                     dtype=numpy.uint64)
+    key[valid] = (_spread_bits(_quantize(x[valid])) |
+                  _spread_bits(_quantize(y[valid])) << numpy.uint64(1))
+    order = numpy.argsort(key, kind='mergesort')
+    return df.iloc[order].reset_index(drop=True)
+
+
+def _quantize(values):
+    """
+    Map values linearly to integers from 0 to 2 ** 16 - 1
+    """
+    low, high = values.min(), values.max()
+    scale = (2 ** 16 - 1) / (high - low) if high > low else 0
+    return ((values - low) * scale).astype(numpy.uint64)
+
+
+def _spread_bits(values):
+    """
+    Spread the (16) bits of integers apart, with zeros between them
+    """
+    for shift, mask in [(8, 0x00FF00FF), (4, 0x0F0F0F0F),
+                        (2, 0x33333333), (1, 0x55555555)]:
+        values = ((values | values << numpy.uint64(shift)) &
+                  numpy.uint64(mask))
+    return values
+
+
+def _frame_size(df):
+    """
+    Estimate the memory used by a GeoDataFrame, in bytes
+
+    pandas does not see the memory used by the shapes, so these are
+    estimated through the size of their WKB representation.
+    """
+    size = df.drop(df.geometry.name, axis=1).memory_usage(deep=True).sum()
+    size += sum(len(geom.wkb) for geom in df.geometry if geom is not None)
+    return int(size)
+
+
+def _get_cache():
+    """
+    Return the cache of frames shared by all TIGER objects
+
+    Its size is read from the configuration file on first use, and can
+    be changed later through its max_size attribute.
+    """
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            config = util.get_configuration()
+            max_size = config['TIGER'].getint('MemoryCacheSize') * 2 ** 20
+            _CACHE = _FrameCache(max_size)
+        return _CACHE
+
+
+# Rows in each row group of the sidecars (see TIGER._update_sidecar)
+_ROW_GROUP_SIZE = 256
+
+# Frames loaded by TIGER objects (see _get_cache)
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
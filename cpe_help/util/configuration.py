@@ -1,4 +1,5 @@
 import configparser
+import re
 
 from cpe_help import util
 
@@ -20,3 +21,34 @@ def get_acs_variables():
               for k, v in config['ACS Variables'].items()
               if k not in default_keys}
     return result
+
+
+def get_acs_moe_variables():
+    """
+    Return a dictionary mapping margin of error variables to be queried
+    into how these variables should be named locally.
+
+    There is one MOE variable for each estimate in get_acs_variables()
+    (e.g. B01003_001M for B01003_001E), named after the estimate with a
+    '_MOE' suffix. The dictionary is empty if MOEs are turned off in the
+    configuration file.
+    """
+    config = get_configuration()
+    if not config['Census'].getboolean('MarginsOfError'):
+        return {}
+
+    result = {}
+    for variable, name in get_acs_variables().items():
+        if re.fullmatch(r'[A-Z0-9]+_[0-9]+E', variable):
+            result[variable[:-1] + 'M'] = name + '_MOE'
+    return result
+
+
+def get_acs_moe_columns():
+    """
+    Return a dictionary mapping local names of ACS estimates into the
+    local names of their margins of error.
+    """
+    estimates = get_acs_variables()
+    return {estimates[variable[:-1] + 'E']: name
+            for variable, name in get_acs_moe_variables().items()}
@@ -63,9 +63,30 @@ def equal_area_from_geodf(df):
     dict
         A dictionary representing a PROJ.4 projection.
     """
-    minx, miny, maxx, maxy = df.total_bounds
+    return equal_area_from_bounds(df.total_bounds, df.crs)
 
-    p1 = pyproj.Proj(df.crs)
+
+def equal_area_from_bounds(bounds, crs):
+    """
+    Return equal-area projection for minimum distortion between bounds
+
+    Useful when the bounds are known without loading the shapes (e.g.
+    from the metadata of a file).
+
+    Parameters
+    ----------
+    bounds : tuple of float
+        (minx, miny, maxx, maxy), in the given CRS.
+    crs : dict or str
+
+    Returns
+    -------
+    dict
+        A dictionary representing a PROJ.4 projection.
+    """
+    minx, miny, maxx, maxy = bounds
+
+    p1 = pyproj.Proj(crs)
     p2 = pyproj.Proj(EPSG4269)  # NAD83
 
     minx, miny = pyproj.transform(p1, p2, minx, miny)
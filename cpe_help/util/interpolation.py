@@ -6,13 +6,25 @@ the process of moving values from one set of polygons (source) to
 another (target).
 """
 
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+
 import geopandas
+import numpy
 import pandas
+import scipy.sparse
+import shapely.geometry
+import shapely.ops
+import shapely.wkb
 
 from cpe_help import util
 
 
-def weighted_areas(source, target, ignore_crs=False):
+def weighted_areas(source, target, ignore_crs=False, engine='sindex',
+                   cache_dir=None, validate='coverage', n_jobs=1,
+                   intensive=None, ratios=None, moe=None):
     """
     Perform weighted areal interpolation from source to target
 
@@ -20,6 +32,16 @@ def weighted_areas(source, target, ignore_crs=False):
     interpolation that makes the assumption that the variable of
     interest is distributed uniformly over the source polygons.
 
+    By default, variables are treated as extensive (counts, such as
+    population): each source contributes with the fraction of its area
+    that lies inside the target. Intensive variables (such as median
+    income or densities) are averaged instead, weighted by the area
+    each source shares with the target. Ratios (such as poverty rates)
+    are recomputed from their interpolated numerators and denominators.
+    Margins of error (MOEs) are propagated from the MOEs of the sources,
+    as the square root of the sum of the squared weighted MOEs. All
+    kinds share the same overlay.
+
     Parameters
     ----------
     source : geopandas.GeoDataFrame
@@ -33,73 +55,949 @@ def weighted_areas(source, target, ignore_crs=False):
         reprojected automatically.
 
         Leave this option the default unless you know what you are doing.
+    engine : {'sindex', 'loop'}, default 'sindex'
+        How to find the pairs of intersecting geometries.
+
+        'sindex' builds a spatial index (R-tree) over the source
+        geometries once and only evaluates the pairs whose bounding
+        boxes overlap. 'loop' compares every target against every
+        source. Both give the same results.
+    cache_dir : str or pathlib.Path, optional
+        If given, the overlay of source and target geometries is stored
+        in this directory, keyed by a hash of the (projected)
+        geometries. Later calls with the same geometries skip all the
+        geometric computations, even if the values changed.
+    validate : {'coverage', 'strict'}, default 'coverage'
+        How to check that the source shapes contain the target shapes.
+
+        'coverage' compares the area of each target with the sum of its
+        intersections with the sources, which come for free with the
+        interpolation. This assumes the source shapes do not overlap
+        (as is the case for Census geographies).
+
+        'strict' compares the union of the targets with the union of
+        the sources. It is slower, but makes no assumptions.
+    n_jobs : int, default 1
+        Number of processes used to compute the overlay. The targets are
+        split into spatially coherent chunks, which are processed in
+        parallel. The results are the same as in the serial case. If -1,
+        use all CPUs.
+    intensive : list of str, optional
+        Names of the columns that hold intensive variables. The other
+        numeric columns are considered extensive.
+    ratios : dict, optional
+        Maps names of columns to be computed to (numerator, denominator)
+        pairs of interpolated columns. A ratio is NaN where its
+        denominator is zero. An existing column with the same name is
+        replaced.
+    moe : dict, optional
+        Maps names of estimate columns to the names of the columns with
+        their margins of error. Each MOE is weighted in the same way as
+        its estimate.
 
     Returns
     -------
     geopandas.GeoDataFrame
         The result CRS is always the same as target's.
+
+    Examples
+    --------
+    >>> weighted_areas(
+    ...     bgs,
+    ...     precincts.geometry,
+    ...     intensive=['MEDIAN_INCOME'],
+    ...     ratios={'POVERTY_RATE': ('POVERTY_BPL', 'POVERTY_TOTAL')},
+    ... )
+
+    See also
+    --------
+    areal_weights : Compute the interpolation weights only once.
+    weighted_areas_many : Interpolate into many targets at once.
+    """
+    results = weighted_areas_many(
+        source,
+        [target],
+        ignore_crs=ignore_crs,
+        engine=engine,
+        cache_dir=cache_dir,
+        validate=validate,
+        n_jobs=n_jobs,
+        intensive=intensive,
+        ratios=ratios,
+        moe=moe,
+    )
+    return results[0]
+
+
+def weighted_areas_many(source, targets, ignore_crs=False, engine='sindex',
+                        cache_dir=None, validate='coverage', n_jobs=1,
+                        intensive=None, ratios=None, moe=None):
+    """
+    Perform weighted areal interpolation from source to many targets
+
+    This is the same as calling weighted_areas once for each target, but
+    the source is reprojected and indexed (and, with validate='strict',
+    unioned) only once.
+
+    Parameters
+    ----------
+    source : geopandas.GeoDataFrame
+        Contains the boundaries and values to interpolate from.
+        Non-numeric columns will be ignored.
+    targets : list of geopandas.GeoSeries
+        Each one contains boundaries to interpolate to.
+    ignore_crs : bool, default False
+        See weighted_areas.
+    engine : {'sindex', 'loop'}, default 'sindex'
+        See weighted_areas.
+    cache_dir : str or pathlib.Path, optional
+        See weighted_areas.
+    validate : {'coverage', 'strict'}, default 'coverage'
+        See weighted_areas.
+    n_jobs : int, default 1
+        See weighted_areas.
+    intensive : list of str, optional
+        See weighted_areas.
+    ratios : dict, optional
+        See weighted_areas.
+    moe : dict, optional
+        See weighted_areas.
+
+    Returns
+    -------
+    list of geopandas.GeoDataFrame
+        One result for each target, in the same order. The CRS of each
+        result is the same as its target's.
+
+    Examples
+    --------
+    >>> city, precincts = weighted_areas_many(bgs, [city, precincts])
     """
 
     # checks
     if not isinstance(source, geopandas.GeoDataFrame):
         raise TypeError("source must be a GeoDataFrame")
-    if not isinstance(target, geopandas.GeoSeries):
-        raise TypeError("target must be a GeoSeries")
     if source.isnull().any(axis=None):
         raise ValueError("source cannot contain null values")
 
-    # CRS conversion and check
+    source, targets, original_crss = _prepare(source, targets, ignore_crs,
+                                              engine, validate)
+
+    source_values = source.select_dtypes(include='number')
+    var_names = source_values.columns
+    source_geoms = source.geometry
+
+    kinds = _column_kinds(var_names, intensive, ratios, moe)
+
+    # algorithm
+    all_areas = _intersection_areas(source_geoms, targets, engine,
+                                    cache_dir, validate, n_jobs)
+
+    # extract values only once, as a contiguous array of floats
+    values = numpy.ascontiguousarray(source_values.values, dtype=float)
+    s_areas = source_geoms.area.values
+
+    results = []
+    for target, areas, original_crs in zip(targets, all_areas,
+                                           original_crss):
+        target_values = _accumulate(areas, values, s_areas, kinds)
+        result = _result_frame(target_values, var_names, target.geometry,
+                               ratios)
+
+        # output must be in target's CRS
+        if not ignore_crs:
+            result = result.to_crs(original_crs)
+
+        results.append(result)
+
+    return results
+
+
+def weighted_areas_from_files(paths, target, n_tiles=16, ignore_crs=False,
+                              engine='sindex', validate='coverage',
+                              intensive=None, ratios=None, moe=None,
+                              values=None, key='GEOID'):
+    """
+    Perform weighted areal interpolation reading the source in tiles
+
+    This gives the same results as weighted_areas, but the source is
+    never fully loaded into memory. Instead, the targets are split into
+    n_tiles spatially coherent tiles and, for each tile, only the source
+    shapes that meet the tile's bounding box are read (and reprojected).
+    This way, peak memory depends on the size of the tiles, not on the
+    size of the source files.
+
+    Parameters
+    ----------
+    paths : str, pathlib.Path or list of those
+        Zipped shapefiles that, together, contain the boundaries and
+        values to interpolate from (e.g. block groups for many states).
+        Non-numeric fields will be ignored.
+    target : geopandas.GeoSeries
+        Contains the boundaries to interpolate to.
+    n_tiles : int, default 16
+        Number of tiles the targets are split into.
+    ignore_crs : bool, default False
+        See weighted_areas.
+    engine : {'sindex', 'loop'}, default 'sindex'
+        See weighted_areas.
+    validate : {'coverage', 'strict'}, default 'coverage'
+        See weighted_areas.
+    intensive : list of str, optional
+        See weighted_areas.
+    ratios : dict, optional
+        See weighted_areas.
+    moe : dict, optional
+        See weighted_areas.
+    values : pandas.DataFrame, optional
+        Values to interpolate, indexed by the key field of the source
+        shapes (e.g. ACS values indexed by GEOID). If given, its
+        numeric columns are interpolated instead of the fields of the
+        files, being joined to each tile after it is read. Every
+        source shape must have a row.
+    key : str, default 'GEOID'
+        Field of the source files that identifies the rows of values.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+        The result CRS is always the same as target's.
+    """
+    if isinstance(paths, (str, pathlib.Path)):
+        paths = [paths]
+    if not paths:
+        raise ValueError("at least one source file must be given")
+
+    # read only the metadata of the source
+    metadata = [util.io.load_zipshp_metadata(path) for path in paths]
+    source_crs = metadata[0]['crs']
+    fields = metadata[0]['schema']['properties']
+    for meta in metadata[1:]:
+        if meta['schema'] != metadata[0]['schema']:
+            raise ValueError("all source files must have the same fields")
+    if values is None:
+        var_names = pandas.Index([
+            name for name, dtype in fields.items()
+            if dtype.startswith(('int', 'float'))
+        ])
+    else:
+        if key not in fields:
+            raise ValueError(f"source files have no {key!r} field")
+        values = values.select_dtypes(include='number')
+        var_names = values.columns
+
+    _check_arguments([target], engine, validate)
+
+    target_geoms = query_geoms = target
+    original_crs = proj = None
     if not ignore_crs:
-        if not source.crs or not target.crs:
+        if not source_crs or not target.crs:
             raise ValueError(f"when ignore_crs=False, both source and target"
                              f" must have specified a CRS")
-        proj = util.crs.equal_area_from_geodf(source)
+        bounds = numpy.array([meta['bounds'] for meta in metadata])
+        bounds = (*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0))
+        proj = util.crs.equal_area_from_bounds(bounds, source_crs)
         original_crs = target.crs
-        source = source.to_crs(proj)
-        target = target.to_crs(proj)
+        target_geoms = target.to_crs(proj)
+        # query boxes must be in the CRS of the files
+        query_geoms = target.to_crs(source_crs)
 
-    source_values = source.select_dtypes(include='number')
-    var_names = source_values.columns
+    kinds = _column_kinds(var_names, intensive, ratios, moe)
+
+    target_values = numpy.zeros((len(target_geoms), len(var_names)))
+    for chunk in _spatial_chunks(query_geoms, n_tiles):
+        tile_targets = target_geoms.iloc[chunk]
+
+        # read the sources of this tile only
+        bounds = _total_bounds(query_geoms.values[chunk])
+        tile = [util.io.load_zipshp(path, bbox=bounds)
+                for path in paths if bounds is not None]
+        tile = [frame for frame in tile if not frame.empty]
+        if tile:
+            tile = pandas.concat(tile, ignore_index=True)
+            if values is not None:
+                tile = tile[[key, 'geometry']].join(values, on=key)
+        else:
+            tile = geopandas.GeoDataFrame(
+                columns=list(var_names) + ['geometry'],
+                geometry='geometry',
+                crs=source_crs or None,
+            )
+        if tile[var_names].isnull().any(axis=None):
+            raise ValueError("source cannot contain null values")
+        if not ignore_crs and not tile.empty:
+            tile = tile.to_crs(proj)
+
+        areas, = _intersection_areas(tile.geometry, [tile_targets], engine,
+                                     validate=validate)
+        tile_values = numpy.ascontiguousarray(tile[var_names].values,
+                                              dtype=float)
+        s_areas = tile.geometry.area.values
+        target_values[chunk] = _accumulate(areas, tile_values, s_areas,
+                                           kinds)
+
+    result = _result_frame(target_values, var_names, target_geoms, ratios)
+
+    # output must be in target's CRS
+    if not ignore_crs:
+        result = result.to_crs(original_crs)
+
+    return result
+
+
+def areal_weights(source, target, ignore_crs=False, engine='sindex',
+                  cache_dir=None, validate='coverage', n_jobs=1,
+                  kind='extensive'):
+    """
+    Compute the weights of a weighted areal interpolation
+
+    The weights only depend on the geometries, so they can be computed
+    once and then applied to as many variables as needed (see
+    apply_weights).
+
+    Parameters
+    ----------
+    source : geopandas.GeoDataFrame or geopandas.GeoSeries
+        Contains the boundaries to interpolate from.
+    target : geopandas.GeoSeries
+        Contains the boundaries to interpolate to.
+    ignore_crs : bool, default False
+        See weighted_areas.
+    engine : {'sindex', 'loop'}, default 'sindex'
+        See weighted_areas.
+    cache_dir : str or pathlib.Path, optional
+        See weighted_areas.
+    validate : {'coverage', 'strict'}, default 'coverage'
+        See weighted_areas.
+    n_jobs : int, default 1
+        See weighted_areas.
+    kind : {'extensive', 'intensive'}, default 'extensive'
+        The kind of variable the weights will be applied to (see
+        weighted_areas).
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        A matrix of shape (len(target), len(source)).
+
+        For extensive variables, the entry at row i and column j is the
+        fraction of the area of the j-th source shape that lies inside
+        the i-th target shape.
+
+        For intensive variables, it is the fraction of the (covered)
+        area of the i-th target shape that lies inside the j-th source
+        shape.
+
+    Examples
+    --------
+    >>> weights = areal_weights(bgs, precincts.geometry)
+    >>> values = apply_weights(weights, bgs, index=precincts.index)
+    """
+    if not isinstance(source, (geopandas.GeoDataFrame, geopandas.GeoSeries)):
+        raise TypeError("source must be a GeoDataFrame or a GeoSeries")
+    if kind not in ('extensive', 'intensive'):
+        raise ValueError("kind must be one of ['extensive', 'intensive']")
+
+    source, targets, _ = _prepare(source, [target], ignore_crs, engine,
+                                  validate)
     source_geoms = source.geometry
-    target_geoms = target.geometry
 
-    # preprocess source
-    target_union = target_geoms.unary_union
-    source_geoms = source_geoms[source_geoms.intersects(target_union)]
+    areas, = _intersection_areas(source_geoms, targets, engine, cache_dir,
+                                 validate, n_jobs)
+    if kind == 'extensive':
+        denominators = source_geoms.area.values[areas.indices]
+    else:
+        covered = numpy.asarray(areas.sum(axis=1)).ravel()
+        rows = numpy.repeat(numpy.arange(areas.shape[0]),
+                            numpy.diff(areas.indptr))
+        denominators = covered[rows]
+
+    data = areas.data / denominators
+    return scipy.sparse.csr_matrix((data, areas.indices, areas.indptr),
+                                   shape=areas.shape)
+
+
+def apply_weights(weights, values, index=None):
+    """
+    Interpolate values using precomputed weights
+
+    Parameters
+    ----------
+    weights : scipy.sparse matrix
+        Weights as returned by areal_weights.
+    values : pandas.DataFrame
+        Values to interpolate, one row per source shape (in the same
+        order used to compute the weights). Non-numeric columns will be
+        ignored.
+    index : pandas.Index, optional
+        The index of the result, usually the index of the targets. If
+        None, a default integer index is used.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per target shape, one column per numeric column of
+        values.
+    """
+    values = values.select_dtypes(include='number')
+    if values.isnull().any(axis=None):
+        raise ValueError("values cannot contain null values")
+    if values.shape[0] != weights.shape[1]:
+        raise ValueError("values must have one row per source shape")
+
+    result = weights.dot(values.values.astype(float))
+    return pandas.DataFrame(result, index=index, columns=values.columns)
+
+
+def _prepare(source, targets, ignore_crs, engine, validate):
+    """
+    Check arguments and project source and targets to an equal-area CRS
+
+    Parameters
+    ----------
+    source : geopandas.GeoDataFrame or geopandas.GeoSeries
+    targets : list of geopandas.GeoSeries
+    ignore_crs : bool
+    engine : str
+    validate : str
+
+    Returns
+    -------
+    source, targets, original_crss
+        The projected source and targets, along with the targets'
+        original CRSs (None if ignore_crs=True).
+    """
+    _check_arguments(targets, engine, validate)
+
+    original_crss = [None] * len(targets)
+    if not ignore_crs:
+        if not source.crs or not all(target.crs for target in targets):
+            raise ValueError(f"when ignore_crs=False, both source and target"
+                             f" must have specified a CRS")
+        proj = util.crs.equal_area_from_geodf(source)
+        original_crss = [target.crs for target in targets]
+        source = source.to_crs(proj)
+        targets = [target.to_crs(proj) for target in targets]
+
+    return source, targets, original_crss
+
+
+def _check_arguments(targets, engine, validate):
+    """
+    Check the arguments shared by every interpolation function
+    """
+    for target in targets:
+        if not isinstance(target, geopandas.GeoSeries):
+            raise TypeError("target must be a GeoSeries")
+    if engine not in _ENGINES:
+        raise ValueError(f"engine must be one of {sorted(_ENGINES)}")
+    if validate not in ('coverage', 'strict'):
+        raise ValueError("validate must be one of ['coverage', 'strict']")
+
+
+def _column_kinds(var_names, intensive, ratios, moe):
+    """
+    Classify each numeric column by how it should be interpolated
+
+    Returns
+    -------
+    list of numpy.ndarray
+        Boolean masks over var_names for, in order: extensive columns,
+        intensive columns, MOEs of extensive columns and MOEs of
+        intensive columns.
+    """
+    intensive = list(intensive or [])
+    ratios = dict(ratios or {})
+    moe = dict(moe or {})
+    unknown = set(intensive) | set(moe) | set(moe.values())
+    for numerator, denominator in ratios.values():
+        unknown |= {numerator, denominator}
+    unknown -= set(var_names)
+    if unknown:
+        raise ValueError(f"unknown numeric columns: {sorted(unknown)}")
+
+    is_intensive = var_names.isin(intensive)
+    is_moe = var_names.isin(list(moe.values()))
+    is_intensive_moe = var_names.isin(
+        [moe[name] for name in moe if name in intensive])
+    if (is_moe & is_intensive).any():
+        raise ValueError("MOE columns cannot be intensive")
+    return [
+        ~is_intensive & ~is_moe,
+        is_intensive,
+        is_moe & ~is_intensive_moe,
+        is_intensive_moe,
+    ]
+
+
+def _accumulate(areas, values, s_areas, kinds):
+    """
+    Interpolate source values to targets given the intersection areas
+
+    Parameters
+    ----------
+    areas : scipy.sparse matrix
+        Intersection areas, with shape (n_targets, n_sources).
+    values : numpy.ndarray
+        Source values, with shape (n_sources, n_columns).
+    s_areas : numpy.ndarray
+        Source areas.
+    kinds : list of numpy.ndarray
+        As returned by _column_kinds.
+
+    Returns
+    -------
+    numpy.ndarray
+        Target values, with shape (n_targets, n_columns).
+    """
+    ext_values, int_values, ext_moes, int_moes = [
+        values[:, kind] for kind in kinds]
+    areas = scipy.sparse.csr_matrix(areas)
+
+    # weights[t, s] is the fraction of source s inside target t
+    with numpy.errstate(divide='ignore'):
+        weights = areas.multiply(1 / s_areas[numpy.newaxis, :]).tocsr()
+    target_ext = weights.dot(ext_values)
+    target_ext_moe = numpy.sqrt(weights.power(2).dot(ext_moes ** 2))
+
+    # intensive variables are averages over the covered area
+    covered = numpy.asarray(areas.sum(axis=1))
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        target_int = areas.dot(int_values) / covered
+        target_int_moe = (numpy.sqrt(areas.power(2).dot(int_moes ** 2))
+                          / covered)
+
+    n_targets = areas.shape[0]
+    target_values = numpy.empty((n_targets, len(kinds[0])))
+    target_values[:, kinds[0]] = target_ext
+    target_values[:, kinds[1]] = target_int
+    target_values[:, kinds[2]] = target_ext_moe
+    target_values[:, kinds[3]] = target_int_moe
+    return target_values
+
+
+def _result_frame(target_values, var_names, target_geoms, ratios):
+    """
+    Build the resulting GeoDataFrame, computing the derived ratios
+    """
+    # target_values is already in the same order as target_geoms
+    frame = pandas.DataFrame(
+        target_values,
+        index=target_geoms.index,
+        columns=var_names,
+    )
+    for name, (numerator, denominator) in dict(ratios or {}).items():
+        numerator = frame[numerator]
+        denominator = frame[denominator]
+        frame[name] = numerator / denominator.where(denominator != 0)
+
+    return geopandas.GeoDataFrame(
+        frame,
+        geometry=target_geoms,
+        crs=target_geoms.crs,
+    )
+
+
+def _intersection_areas(source_geoms, targets, engine, cache_dir=None,
+                        validate='coverage', n_jobs=1):
+    """
+    Compute the areas of intersection between targets and sources
+
+    Also checks that the source shapes contain the target shapes (unless
+    the result comes from the cache, when it was checked before).
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+    targets : list of geopandas.GeoSeries
+    engine : str
+        One of the keys of _ENGINES.
+    cache_dir : str or pathlib.Path, optional
+        Directory to look up and store the results. The file names are
+        fingerprints of source_geoms and each of the targets.
+    validate : {'coverage', 'strict'}, default 'coverage'
+        See weighted_areas.
+    n_jobs : int, default 1
+        See weighted_areas.
+
+    Returns
+    -------
+    list of scipy.sparse.csr_matrix
+        One matrix of shape (len(target), len(source_geoms)) for each
+        target.
+    """
+    results = [None] * len(targets)
+
+    if cache_dir is not None:
+        paths = []
+        for i, target_geoms in enumerate(targets):
+            key = _fingerprint(source_geoms, target_geoms)
+            path = pathlib.Path(cache_dir) / f'{key}.npz'
+            if path.exists():
+                results[i] = scipy.sparse.load_npz(str(path))
+            paths.append(path)
+
+    pending = [i for i, result in enumerate(results) if result is None]
+    if not pending:
+        return results
+
+    if validate == 'strict':
+        # restrict source, but keep track of the original positions
+        target_unions = [targets[i].unary_union for i in pending]
+        positions = _relevant_sources(source_geoms, target_unions)
+    else:
+        positions = numpy.arange(len(source_geoms))
+    restricted = source_geoms.iloc[positions]
+    s_areas = source_geoms.area.values
+
+    # index the source only once
+    candidates = _ENGINES[engine](restricted)
+    for i in pending:
+        target_geoms = targets[i]
+
+        if n_jobs == 1:
+            pairs = _overlay(restricted, target_geoms, candidates)
+        else:
+            pairs = _parallel_overlay(restricted, target_geoms, candidates,
+                                      engine, n_jobs)
+
+        rows, cols, data = [], [], []
+        for t_pos, s_pos, area in pairs:
+            rows.append(t_pos)
+            cols.append(positions[s_pos])
+            data.append(area)
+
+        shape = (len(target_geoms), len(source_geoms))
+        areas = scipy.sparse.csr_matrix((data, (rows, cols)), shape=shape)
+        if validate == 'coverage':
+            _check_coverage(areas, target_geoms, s_areas)
+        results[i] = areas
+
+        if cache_dir is not None:
+            util.file.maybe_mkdir(cache_dir)
+            # write atomically, so an interrupted run never leaves a
+            # corrupt entry behind
+            tmp_path = paths[i].with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, mode='wb') as f:
+                scipy.sparse.save_npz(f, areas)
+            os.replace(tmp_path, paths[i])
+
+    return results
+
+
+def _relevant_sources(source_geoms, target_unions):
+    """
+    Return the positions of the source geometries that meet the targets
+
+    Also checks that the source shapes contain the target shapes. The
+    union of the relevant sources is computed only once.
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+    target_unions : list of shapely geometries
+        The union of each set of targets.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer positions in source_geoms.
+    """
+    target_union = shapely.ops.unary_union(target_unions)
+    positions = numpy.flatnonzero(source_geoms.intersects(target_union))
+    source_geoms = source_geoms.iloc[positions]
+    source_union = source_geoms.unary_union
 
     # check if source contains target
     # must give some tolerance because of projection distortions
     # (if area is 1km^2, tolerance is 1m^2)
     # you may increase tolarance a bit if it gets problematic
     tol = source_geoms.area.min() * 1e-6
-    diff = target_geoms.unary_union - source_geoms.unary_union
-    if not diff.area < tol:
+    for target_union in target_unions:
+        diff = target_union - source_union
+        if not diff.area < tol:
+            raise ValueError("source shapes must contain target shapes")
+
+    return positions
+
+
+def _check_coverage(areas, target_geoms, s_areas):
+    """
+    Check that the source shapes contain the target shapes
+
+    A target is covered when the sum of its intersection areas with the
+    sources equals its own area.
+
+    Parameters
+    ----------
+    areas : scipy.sparse.csr_matrix
+        Intersection areas, one row per target and one column per
+        source.
+    target_geoms : geopandas.GeoSeries
+    s_areas : numpy.ndarray
+        The area of each source.
+    """
+    covered = numpy.asarray(areas.sum(axis=1)).ravel()
+    missing = target_geoms.area.values - covered
+
+    # same tolerance as the strict check (see _relevant_sources)
+    if areas.nnz > 0:
+        tol = s_areas[areas.indices].min() * 1e-6
+    else:
+        tol = 0
+    if not (missing < tol).all():
         raise ValueError("source shapes must contain target shapes")
 
-    # algorithm
-    target_values = []
-    for t_id, t_geom in target_geoms.iteritems():
-        # calculate target value (actually an array of values)
-        t_value = pandas.Series(0, index=var_names)
-        for s_id, s_geom in source_geoms.iteritems():
+
+def _fingerprint(source_geoms, target_geoms):
+    """
+    Return a hash identifying the geometries used in an overlay
+
+    The CRS of both series is part of the hash, so reprojected
+    geometries get a different fingerprint.
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+    target_geoms : geopandas.GeoSeries
+
+    Returns
+    -------
+    str
+    """
+    digest = hashlib.sha1()
+    for geoms in [source_geoms, target_geoms]:
+        header = f'{geoms.crs!r}:{len(geoms)}:'
+        digest.update(header.encode())
+        for geom in geoms.values:
+            digest.update(geom.wkb)
+    return digest.hexdigest()
+
+
+def _overlay(source_geoms, target_geoms, candidates):
+    """
+    Find the pairs of intersecting target and source geometries
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+    target_geoms : geopandas.GeoSeries
+    candidates : callable
+        As returned by one of the _ENGINES, built from source_geoms.
+
+    Yields
+    ------
+    (int, int, float)
+        The position of the target, the position of the source and the
+        area of their intersection. Pairs are ordered by target, then
+        by source.
+    """
+    s_geoms = source_geoms.values
+    for t_pos, t_geom in enumerate(target_geoms.values):
+        for s_pos in candidates(t_geom):
+            s_geom = s_geoms[s_pos]
             if t_geom.intersects(s_geom):
                 intersect = t_geom.intersection(s_geom)
-                ratio = intersect.area / s_geom.area
-                s_value = source_values.loc[s_id]
-                t_value += s_value * ratio
+                yield t_pos, s_pos, intersect.area
 
-        t_value.name = t_id
-        target_values.append(t_value)
 
-    # target_values is already in the same order as target_geoms
-    result = geopandas.GeoDataFrame(
-        target_values,
-        geometry=target_geoms,
-        crs=target_geoms.crs,
+def _parallel_overlay(source_geoms, target_geoms, candidates, engine,
+                      n_jobs):
+    """
+    Same as _overlay, but distributing chunks of targets among processes
+
+    Geometries are sent to the workers as WKB, which is lossless, so the
+    results are exactly the same as the ones of _overlay.
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+    target_geoms : geopandas.GeoSeries
+    candidates : callable
+        As returned by one of the _ENGINES, built from source_geoms.
+    engine : str
+        The engine the workers should use.
+    n_jobs : int
+        Number of processes. If -1, use all CPUs.
+
+    Returns
+    -------
+    list of (int, int, float)
+        Same as _overlay.
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+
+    # a few chunks per process helps balancing the load
+    t_chunks = _spatial_chunks(target_geoms, n_jobs * 4)
+
+    s_geoms = source_geoms.values
+    t_geoms = target_geoms.values
+    s_chunks = []
+    for t_chunk in t_chunks:
+        # sources that may intersect any target in the chunk
+        bounds = _total_bounds(t_geoms[t_chunk])
+        if bounds is None:
+            s_chunks.append([])
+        else:
+            s_chunks.append(candidates(shapely.geometry.box(*bounds)))
+
+    with concurrent.futures.ProcessPoolExecutor(n_jobs) as executor:
+        partials = executor.map(
+            _overlay_wkb,
+            [engine] * len(t_chunks),
+            [[geom.wkb for geom in t_geoms[chunk]] for chunk in t_chunks],
+            [[geom.wkb for geom in s_geoms[chunk]] for chunk in s_chunks],
+        )
+        partials = list(partials)
+
+    # translate back to positions in target_geoms and source_geoms
+    pairs = []
+    for t_chunk, s_chunk, partial in zip(t_chunks, s_chunks, partials):
+        for t_pos, s_pos, area in partial:
+            pairs.append((t_chunk[t_pos], s_chunk[s_pos], area))
+
+    # same order as _overlay
+    pairs.sort(key=lambda pair: pair[:2])
+    return pairs
+
+
+def _overlay_wkb(engine, target_wkbs, source_wkbs):
+    """
+    Run _overlay over geometries serialized as WKB
+
+    This runs in the worker processes of _parallel_overlay.
+
+    Returns
+    -------
+    list of (int, int, float)
+        Same as _overlay.
+    """
+    target_geoms = geopandas.GeoSeries(
+        [shapely.wkb.loads(wkb) for wkb in target_wkbs])
+    source_geoms = geopandas.GeoSeries(
+        [shapely.wkb.loads(wkb) for wkb in source_wkbs])
+    candidates = _ENGINES[engine](source_geoms)
+    return list(_overlay(source_geoms, target_geoms, candidates))
+
+
+def _spatial_chunks(geoms, n_chunks):
+    """
+    Split geometries into chunks of geometries near each other
+
+    Geometries are sorted along a Z-order curve through the centers of
+    their bounding boxes, and then split into contiguous chunks.
+
+    Parameters
+    ----------
+    geoms : geopandas.GeoSeries
+    n_chunks : int
+
+    Returns
+    -------
+    list of numpy.ndarray
+        Integer positions in geoms, one array per (non-empty) chunk.
+    """
+    centers = numpy.zeros((len(geoms), 2))
+    for i, geom in enumerate(geoms.values):
+        if not geom.is_empty:
+            minx, miny, maxx, maxy = geom.bounds
+            centers[i] = (minx + maxx) / 2, (miny + maxy) / 2
+
+    # scale centers to integers in [0, 2^16)
+    low = centers.min(axis=0)
+    span = centers.max(axis=0) - low
+    span[span == 0] = 1
+    cells = ((centers - low) / span * (2 ** 16 - 1)).astype(numpy.int64)
+
+    # interleave the bits of x and y
+    codes = numpy.zeros(len(geoms), dtype=numpy.int64)
+    for bit in range(16):
+        codes |= ((cells[:, 0] >> bit) & 1) << (2 * bit)
+        codes |= ((cells[:, 1] >> bit) & 1) << (2 * bit + 1)
+
+    order = numpy.argsort(codes, kind='mergesort')
+    chunks = numpy.array_split(order, n_chunks)
+    return [chunk for chunk in chunks if len(chunk) > 0]
+
+
+def _total_bounds(geoms):
+    """
+    Return the bounds of a sequence of geometries
+
+    Parameters
+    ----------
+    geoms : sequence of shapely geometries
+
+    Returns
+    -------
+    tuple or None
+        (minx, miny, maxx, maxy), or None if all geometries are empty.
+    """
+    bounds = [geom.bounds for geom in geoms if not geom.is_empty]
+    if not bounds:
+        return None
+    bounds = numpy.array(bounds)
+    return (
+        bounds[:, 0].min(),
+        bounds[:, 1].min(),
+        bounds[:, 2].max(),
+        bounds[:, 3].max(),
     )
 
-    # output must be in target's CRS
-    if not ignore_crs:
-        result = result.to_crs(original_crs)
 
-    return result
+def _loop_candidates(source_geoms):
+    """
+    Return a function listing every source as a candidate for a target
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+
+    Returns
+    -------
+    callable
+        Receives a target geometry and returns a list of positions in
+        source_geoms.
+    """
+    positions = list(range(len(source_geoms)))
+
+    def candidates(t_geom):
+        return positions
+
+    return candidates
+
+
+def _sindex_candidates(source_geoms):
+    """
+    Return a function listing the sources whose bounds meet a target's
+
+    The spatial index is built only once, when this function is called.
+    Candidates are returned in the same order as they appear in
+    source_geoms, so the results match the ones of the 'loop' engine.
+
+    Parameters
+    ----------
+    source_geoms : geopandas.GeoSeries
+
+    Returns
+    -------
+    callable
+        Receives a target geometry and returns a list of positions in
+        source_geoms.
+    """
+    sindex = source_geoms.sindex
+
+    def candidates(t_geom):
+        # an empty index (or geometry) has nothing to intersect with
+        if sindex is None or t_geom.is_empty:
+            return []
+        return sorted(sindex.intersection(t_geom.bounds))
+
+    return candidates
+
+
+_ENGINES = {
+    'loop': _loop_candidates,
+    'sindex': _sindex_candidates,
+}
@@ -6,7 +6,14 @@ import json
 import pathlib
 import tempfile
 
+import fiona
 import geopandas
+import numpy
+import pandas
+import pyarrow
+import pyarrow.parquet
+import rtree.index
+import shapely.wkb
 
 from cpe_help import util
 
@@ -95,18 +102,260 @@ def save_geojson(df, path):
     df.to_file(str(path), driver='GeoJSON')
 
 
-def load_zipshp(path):
+def load_zipshp(path, bbox=None):
     """
     Load a zipped shapefile
 
     This is just the usual shapefile, but, instead of the usual
     directory, we keep the contents in a zipfile, for the ease of
     handling.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+    bbox : tuple of float, optional
+        (minx, miny, maxx, maxy), in the file's CRS. If given, only the
+        shapes intersecting this box are read.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+    """
+    return geopandas.read_file(_zip_uri(path), bbox=bbox)
+
+
+def load_zipshp_metadata(path):
+    """
+    Load the metadata of a zipped shapefile, without reading its shapes
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+
+    Returns
+    -------
+    dict
+        With keys 'crs', 'bounds', 'schema' and 'length'.
+    """
+    with fiona.open(_zip_uri(path)) as f:
+        return {
+            'crs': f.crs,
+            'bounds': f.bounds,
+            'schema': f.schema,
+            'length': len(f),
+        }
+
+
+def load_geoparquet(path, columns=None, where=None, bbox=None, rows=None):
+    """
+    Load a GeoDataFrame saved with save_geoparquet
+
+    Rows can be filtered while reading: only the geometries of the
+    matching rows are decoded.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+    columns : list of str, optional
+        If given, only these columns (and the geometry) are read.
+    where : dict, optional
+        Mapping of column names to lists of accepted values. Only rows
+        with accepted values in all of these columns are read.
+    bbox : tuple of float, optional
+        (minx, miny, maxx, maxy), in the file's CRS. If given, only the
+        shapes whose bounding boxes intersect this box are read.
+    rows : list of int, optional
+        If given, only the rows at these positions (in the file) are
+        read, e.g. the candidates found through a spatial index. Only
+        the row groups holding them are read from disk.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+    """
+    where = dict(where or {})
+    read_columns = None
+    if columns is not None:
+        columns = list(columns) + ['geometry']
+        read_columns = columns + [name for name in where
+                                  if name not in columns]
+        if bbox is not None:
+            read_columns += _BBOX_COLUMNS
+    if rows is not None:
+        table, rows = _read_row_groups(path, read_columns, rows)
+    else:
+        table = pyarrow.parquet.read_table(str(path), columns=read_columns)
+    meta = json.loads(table.schema.metadata[b'geo'])
+    df = table.to_pandas()
+
+    # filter before decoding the geometries
+    mask = numpy.ones(len(df), dtype=bool)
+    for name, values in where.items():
+        mask &= df[name].isin(values).values
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        mask &= ((df['_minx'] <= maxx) & (df['_maxx'] >= minx) &
+                 (df['_miny'] <= maxy) & (df['_maxy'] >= miny)).values
+    if rows is not None:
+        selected = numpy.zeros(len(df), dtype=bool)
+        selected[rows] = True
+        mask &= selected
+    if not mask.all():
+        df = df[mask].reset_index(drop=True)
+
+    df = df.drop(_BBOX_COLUMNS, axis=1, errors='ignore')
+    if columns is not None:
+        df = df[columns]
+    geometry = geopandas.GeoSeries(
+        [shapely.wkb.loads(x) if x is not None else None
+         for x in df.pop('geometry')],
+        index=df.index,
+    )
+    return geopandas.GeoDataFrame(
+        df,
+        geometry=geometry,
+        crs=meta['columns']['geometry']['crs'],
+    )
+
+
+def save_geoparquet(df, path, row_group_size=None):
+    """
+    Save a GeoDataFrame as a (Geo)Parquet file
+
+    Geometries are stored as WKB, along with their bounding boxes (so
+    that readers can filter shapes without decoding them). The CRS is
+    kept in the file's metadata.
+
+    Parameters
+    ----------
+    df : geopandas.GeoDataFrame
+    path : str or pathlib.Path
+    row_group_size : int, optional
+        Maximum number of rows in each row group. Reading a few rows
+        (see load_geoparquet) only reads the row groups holding them,
+        so it pays to have shapes close in space close in df too.
+    """
+    frame = pandas.DataFrame(df.drop(df.geometry.name, axis=1))
+    frame['geometry'] = [geom.wkb if geom is not None else None
+                         for geom in df.geometry]
+    bounds = df.geometry.bounds
+    for column, bound in zip(_BBOX_COLUMNS, ['minx', 'miny', 'maxx', 'maxy']):
+        frame[column] = bounds[bound].values
+
+    crs = df.crs
+    if crs is not None and not isinstance(crs, (dict, str)):
+        crs = crs.to_string()
+    meta = {
+        'version': '0.1.0',
+        'primary_column': 'geometry',
+        'columns': {'geometry': {'encoding': 'WKB', 'crs': crs}},
+    }
+
+    table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b'geo'] = json.dumps(meta).encode()
+    table = table.replace_schema_metadata(metadata)
+    pyarrow.parquet.write_table(table, str(path),
+                                row_group_size=row_group_size)
+
+
+def save_geoparquet_index(path, index_path):
+    """
+    Save a spatial index (R-tree) over the shapes of a (Geo)Parquet file
+
+    The tree is packed (bulk loaded) from the bounding boxes stored by
+    save_geoparquet, so no geometry is decoded. Its ids are the
+    positions of the rows in the file, to be passed to load_geoparquet.
+
+    Parameters
+    ----------
+    path : str or pathlib.Path
+        File saved with save_geoparquet.
+    index_path : str or pathlib.Path
+        Base name of the index. Two files are written, named after it
+        plus '.idx' and '.dat'.
+    """
+    table = pyarrow.parquet.read_table(str(path), columns=_BBOX_COLUMNS)
+    boxes = table.to_pandas()
+    boxes = boxes[boxes.notnull().all(axis=1)]
+
+    properties = rtree.index.Property()
+    properties.overwrite = True
+    if len(boxes) > 0:
+        stream = ((int(i), tuple(box), None)
+                  for i, box in zip(boxes.index, boxes.values))
+        index = rtree.index.Index(str(index_path), stream,
+                                  properties=properties)
+    else:
+        # libspatialindex refuses to bulk load an empty stream
+        index = rtree.index.Index(str(index_path), properties=properties)
+    # flush to disk
+    del index
+
+
+def query_geoparquet_index(index_path, bbox):
+    """
+    Find the rows of a (Geo)Parquet file whose shapes may intersect a box
+
+    Parameters
+    ----------
+    index_path : str or pathlib.Path
+        Base name of an index saved with save_geoparquet_index.
+    bbox : tuple of float
+        (minx, miny, maxx, maxy), in the file's CRS.
+
+    Returns
+    -------
+    list of int
+        Sorted positions of the rows whose bounding boxes intersect
+        bbox.
+    """
+    index = rtree.index.Index(str(index_path))
+    return sorted(index.intersection(tuple(bbox)))
+
+
+def _read_row_groups(path, columns, rows):
+    """
+    Read the row groups of a Parquet file holding the given rows
+
+    Returns
+    -------
+    table : pyarrow.Table
+        The row groups, in order.
+    rows : numpy.ndarray
+        Positions of the given rows in table.
+    """
+    parquet_file = pyarrow.parquet.ParquetFile(str(path))
+    sizes = [parquet_file.metadata.row_group(i).num_rows
+             for i in range(parquet_file.num_row_groups)]
+    if not sizes:
+        table = pyarrow.parquet.read_table(str(path), columns=columns)
+        return table, numpy.array([], dtype=int)
+    starts = numpy.cumsum([0] + sizes)
+
+    rows = numpy.asarray(rows, dtype=int)
+    row_groups = numpy.searchsorted(starts, rows, side='right') - 1
+    needed = numpy.unique(row_groups)
+    if len(needed) == 0:
+        table = parquet_file.read_row_group(0, columns=columns)
+        return table.slice(0, 0), rows
+
+    table = pyarrow.concat_tables([
+        parquet_file.read_row_group(i, columns=columns) for i in needed])
+    # where each needed row group starts in table
+    new_starts = numpy.cumsum([0] + [sizes[i] for i in needed])
+    position = numpy.searchsorted(needed, row_groups)
+    rows = rows - starts[row_groups] + new_starts[position]
+    return table, rows
+
+
+def _zip_uri(path):
+    """
+    Return the URI fiona uses to read a zipped shapefile
     """
     # https://commons.apache.org/proper/commons-vfs/filesystems.html
     # using the URI directly doesn't seem documented in fiona, but it works
-    uri = f'zip://{path}'
-    return geopandas.read_file(uri)
+    return f'zip://{path}'
 
 
 def save_zipshp(df, path):
@@ -122,6 +371,10 @@ def save_zipshp(df, path):
         util.compression.make_zipfile(path, tmpdir)
 
 
+# Bounding box of each shape, in files saved by save_geoparquet
+_BBOX_COLUMNS = ['_minx', '_miny', '_maxx', '_maxy']
+
+
 def _get_dt_format():
     """
     Return the datetime format that should be used in the outputs
@@ -1,13 +1,29 @@
-import subprocess
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import re
+import threading
+import time
+import zipfile
+
+import requests
+import requests.adapters
 
 from cpe_help import util
 
 
-def download(url, out):
+def download(url, out, sha256=None):
     """
     Download a file from url to out
 
-    If out already exists, it is replaced.
+    The file is first downloaded to out + '.part', and only replaces
+    out (if it exists) after being verified. If the download is
+    interrupted, it is resumed from where it stopped, here or in a
+    later call (through HTTP range requests).
+
+    The downloaded file must have the size announced by the server,
+    and, for ZIP archives, all members must match their CRCs.
 
     Parameters
     ----------
@@ -15,35 +31,207 @@ def download(url, out):
         The url to download from.
     out : str or Path
         The path to download to.
+    sha256 : str, optional
+        Expected SHA-256 (hex digest) of the file.
 
     Returns
     -------
     None
     """
-    out = str(out)
-    # delete file if it already exists
-    util.file.maybe_rmfile(out)
-    _download(url, out)
+    config = util.get_configuration()['Downloads']
+    max_retries = config.getint('MaxRetries')
+    timeout = config.getfloat('Timeout')
+
+    out = pathlib.Path(out)
+    part = out.with_name(out.name + '.part')
+    session = _get_session()
+
+    for attempt in range(max_retries + 1):
+        try:
+            if _download_part(session, url, part, timeout):
+                break
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == max_retries:
+                raise
+        except requests.HTTPError as e:
+            if (e.response.status_code not in _RETRY_STATUSES or
+                    attempt == max_retries):
+                raise
+        else:
+            if attempt == max_retries:
+                raise IOError(f"{url}: download incomplete after"
+                              f" {max_retries} retries")
+        time.sleep(_BACKOFF * 2 ** attempt)
+
+    try:
+        _verify(part, sha256, archive=out.suffix == '.zip')
+    except ValueError as e:
+        # corrupt data can't be resumed, start over next time
+        util.file.maybe_rmfile(part)
+        raise ValueError(f"{url}: {e}") from e
+
+    os.replace(part, out)
 
 
-def _download(url, out):
+def download_many(downloads, max_workers=None):
     """
-    Download a file, no checks
+    Download many files at the same time
 
     Parameters
     ----------
-    url : str
-    out : str or Path
+    downloads : list of tuple
+        (url, out) pairs, as accepted by download.
+    max_workers : int, optional
+        Maximum number of simultaneous downloads. If None, use the
+        value present in the configuration file.
+
+    Returns
+    -------
+    None
+    """
+    if max_workers is None:
+        config = util.get_configuration()['Downloads']
+        max_workers = config.getint('MaxConcurrentDownloads')
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(download, url, out)
+                   for url, out in downloads]
+    # raise the first error (if any), after all downloads are done
+    for future in futures:
+        future.result()
+
+
+def _download_part(session, url, part, timeout):
+    """
+    Download (the rest of) a file to part
+
+    Returns
+    -------
+    bool
+        Whether the file is complete.
+    """
+    try:
+        offset = part.stat().st_size
+    except FileNotFoundError:
+        offset = 0
+
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    r = session.get(url, headers=headers, stream=True, timeout=timeout)
+    try:
+        if r.status_code == 416:
+            # nothing left to download, or the part is not from this
+            # file anymore
+            if _total_size(r) == offset:
+                return True
+            util.file.maybe_rmfile(part)
+            return False
+        r.raise_for_status()
+
+        if r.status_code == 206:
+            start = int(_CONTENT_RANGE.match(r.headers['Content-Range'])[1])
+            if start != offset:
+                raise ValueError(f"{url}: asked for bytes from {offset},"
+                                 f" got from {start}")
+            mode = 'ab'
+        else:
+            # the server ignored the range, start over
+            offset = 0
+            mode = 'wb'
+
+        total = _total_size(r)
+        with open(part, mode) as f:
+            for chunk in r.iter_content(2 ** 16):
+                f.write(chunk)
+    except requests.exceptions.ChunkedEncodingError:
+        # the connection broke mid-way (what was written is kept)
+        return False
+    finally:
+        r.close()
+
+    size = part.stat().st_size
+    if total is not None and size > total:
+        util.file.maybe_rmfile(part)
+        raise ValueError(f"{url}: got {size} bytes, expected {total}")
+    return total is None or size == total
+
+
+def _total_size(response):
+    """
+    Return the full size of the file being served, or None if unknown
+    """
+    if 'Content-Range' in response.headers:
+        match = _CONTENT_RANGE.match(response.headers['Content-Range'])
+        if match and match[3] != '*':
+            return int(match[3])
+        return None
+    if response.status_code == 200 and 'Content-Length' in response.headers:
+        return int(response.headers['Content-Length'])
+    return None
+
+
+def _verify(path, sha256=None, archive=False):
+    """
+    Check the integrity of a downloaded file (a ZIP archive if archive)
+
+    Raises
+    ------
+    ValueError
+        If the file does not match sha256, or if it is a corrupt ZIP
+        archive.
     """
-    ua = util.get_configuration()['Downloads']['UserAgent']
-    subprocess.run([
-        'http',
-        '--ignore-stdin',
-        '--check-status',
-        '--timeout=2.0',
-        '--print=',
-        '--output', str(out),
-        '--download',
-        url,
-        'User-Agent:' + ua,
-    ], check=True)
+    if sha256 is not None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != sha256.lower():
+            raise ValueError(f"SHA-256 is {digest.hexdigest()},"
+                             f" expected {sha256}")
+
+    if archive:
+        try:
+            with zipfile.ZipFile(path) as f:
+                bad = f.testzip()
+        except zipfile.BadZipFile as e:
+            raise ValueError(f"corrupt ZIP archive ({e})") from e
+        if bad is not None:
+            raise ValueError(f"corrupt ZIP archive (bad CRC for {bad})")
+
+
+def _get_session():
+    """
+    Return the HTTP session shared by all downloads
+
+    Returns
+    -------
+    requests.Session
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            config = util.get_configuration()['Downloads']
+            adapter = requests.adapters.HTTPAdapter(
+                pool_maxsize=config.getint('MaxConcurrentDownloads'),
+            )
+            _SESSION = requests.Session()
+            _SESSION.mount('https://', adapter)
+            _SESSION.mount('http://', adapter)
+            _SESSION.headers['User-Agent'] = config['UserAgent']
+            # files are saved as served: a compressed response would
+            # not match the announced size, nor the range offsets
+            _SESSION.headers['Accept-Encoding'] = 'identity'
+        return _SESSION
+
+
+# Transient failures, worth retrying
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# e.g. 'bytes 100-199/1000' or 'bytes */1000'
+_CONTENT_RANGE = re.compile(r'bytes (\d+|\*)-?(\d*)/(\d+|\*)')
+
+# Seconds to wait before the first retry (doubled on each retry)
+_BACKOFF = 1.0
+
+# Session used for downloads (see _get_session)
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
@@ -16,6 +16,7 @@ from cpe_help import (
     TIGER,
     util,
 )
+from cpe_help.acs import from_configuration as acs_from_configuration
 
 
 def task_download_state_boundaries():
@@ -32,20 +33,6 @@ def task_download_state_boundaries():
     }
 
 
-def task_download_county_boundaries():
-    """
-    Download county boundaries from the TIGER shapefiles
-    """
-    tiger = TIGER()
-    file = tiger.county_boundaries_path
-    return {
-        'file_dep': [util.path.CONFIG_PATH],
-        'targets': [file],
-        'actions': [tiger.download_county_boundaries],
-        'uptodate': [doit.tools.run_once],
-    }
-
-
 def task_guess_states():
     """
     Guess the state for each department
@@ -78,10 +65,7 @@ def task_guess_counties():
                 dept.guessed_city_path,
                 dept.preprocessed_shapefile_path,
             ],
-            'task_dep': [
-                'download_place_boundaries',
-                'download_county_boundaries',
-            ],
+            'task_dep': ['download_boundaries'],
             'targets': [dept.guessed_counties_path],
             'actions': [dept.guess_counties],
             'clean': True,
@@ -99,7 +83,7 @@ def task_guess_cities():
                 dept.preprocessed_shapefile_path,
                 dept.guessed_state_path,
             ],
-            'task_dep': ['download_place_boundaries'],
+            'task_dep': ['download_boundaries'],
             'targets': [dept.guessed_city_path],
             'actions': [dept.guess_city],
             'clean': True,
@@ -130,90 +114,100 @@ def task_preprocess_shapefiles():
         }
 
 
-def task_download_tract_values():
+@doit.create_after('create_list_of_states')
+def task_download_state_values():
+    """
+    Download census tract and block group values for each relevant
+    state
+    """
+    acs = acs_from_configuration()
+    for state in list_states():
+        yield {
+            'name': state,
+            'file_dep': [util.path.CONFIG_PATH],
+            'actions': [(acs.download_values, (state,))],
+            'targets': [
+                acs.tract_values_path(state),
+                acs.bg_values_path(state),
+            ],
+            'clean': True,
+        }
+
+
+@doit.create_after('create_list_of_states')
+def task_extract_tract_values():
     """
-    Download census tract values for each department
+    Extract census tract values for each department
     """
+    acs = acs_from_configuration()
     for dept in Department.list():
+        state = dept.load_guessed_state()
         yield {
             'name': dept.name,
             'file_dep': [
                 dept.guessed_state_path,
                 dept.guessed_counties_path,
+                acs.tract_values_path(state),
                 util.path.CONFIG_PATH,
             ],
             'targets': [dept.tract_values_path],
-            'actions': [dept.download_tract_values],
+            'actions': [dept.extract_tract_values],
             'clean': True,
         }
 
 
-def task_download_bg_values():
+@doit.create_after('create_list_of_states')
+def task_extract_bg_values():
+    """
+    Extract block group values for each department
+    """
+    acs = acs_from_configuration()
     for dept in Department.list():
+        state = dept.load_guessed_state()
         yield {
             'name': dept.name,
             'file_dep': [
                 dept.guessed_state_path,
                 dept.guessed_counties_path,
+                acs.bg_values_path(state),
                 util.path.CONFIG_PATH,
             ],
             'targets': [dept.bg_values_path],
-            'actions': [dept.download_bg_values],
+            'actions': [dept.extract_bg_values],
             'clean': True,
         }
 
 
 @doit.create_after('create_list_of_states')
-def task_download_tract_boundaries():
+def task_download_boundaries():
     """
-    Download census tract boundaries for each state
-    """
-    tiger = TIGER()
-    for state in list_states():
-        yield {
-            'name': state,
-            'file_dep': [util.path.CONFIG_PATH],
-            'actions': [(tiger.download_tract_boundaries, (state,))],
-            'targets': [tiger.tract_boundaries_path(state)],
-            'uptodate': [doit.tools.run_once],
-        }
+    Download county boundaries, and census tract, block group and place
+    boundaries for each relevant state
 
-
-@doit.create_after('create_list_of_states')
-def task_download_bg_boundaries():
-    """
-    Download block group boundaries for each relevant state
-    """
-    tiger = TIGER()
-    for state in list_states():
-        yield {
-            'name': state,
-            'file_dep': [util.path.CONFIG_PATH],
-            'actions': [(tiger.download_bg_boundaries, (state,))],
-            'targets': [tiger.bg_boundaries_path(state)],
-            'uptodate': [doit.tools.run_once],
-        }
-
-
-@doit.create_after('create_list_of_states')
-def task_download_place_boundaries():
-    """
-    Download place boundaries for each relevant state
+    Files are downloaded at the same time. State boundaries have their
+    own task, since they are needed for listing the relevant states.
     """
     tiger = TIGER()
-    for state in list_states():
-        yield {
-            'name': state,
-            'file_dep': [util.path.CONFIG_PATH],
-            'actions': [(tiger.download_place_boundaries, (state,))],
-            'targets': [tiger.place_boundaries_path(state)],
-            'uptodate': [doit.tools.run_once],
-        }
+    states = list_states()
+    targets = [tiger.county_boundaries_path]
+    for state in states:
+        targets += [
+            tiger.tract_boundaries_path(state),
+            tiger.bg_boundaries_path(state),
+            tiger.place_boundaries_path(state),
+        ]
+    return {
+        'file_dep': [util.path.CONFIG_PATH],
+        'actions': [(tiger.download_boundaries, (states,))],
+        'targets': targets,
+        'uptodate': [doit.tools.run_once],
+    }
 
 
-def task_process_city():
+def task_process_city_and_police_precincts():
     """
-    Generate statistics for the city of each department
+    Generate statistics for the city and police precincts of each
+    department
     """
     for dept in Department.list():
         yield {
@@ -221,10 +215,11 @@ def task_process_city():
             'file_dep': [
                 dept.block_groups_path,
                 dept.guessed_city_path,
+                dept.preprocessed_shapefile_path,
             ],
-            'task_dep': ['download_place_boundaries'],
-            'targets': [dept.city_path],
-            'actions': [dept.process_city],
+            'task_dep': ['download_boundaries'],
+            'targets': [dept.city_path, dept.police_precincts_path],
+            'actions': [dept.process_city_and_police_precincts],
             'clean': True,
         }
 
@@ -241,7 +236,7 @@ def task_process_census_tracts():
                 dept.guessed_counties_path,
                 dept.tract_values_path,
             ],
-            'task_dep': ['download_tract_boundaries'],
+            'task_dep': ['download_boundaries'],
             'targets': [dept.census_tracts_path],
             'actions': [dept.process_census_tracts],
             'clean': True,
@@ -260,30 +255,13 @@ def task_process_block_groups():
                 dept.guessed_counties_path,
                 dept.bg_values_path,
             ],
-            'task_dep': ['download_bg_boundaries'],
+            'task_dep': ['download_boundaries'],
             'targets': [dept.block_groups_path],
             'actions': [dept.process_block_groups],
             'clean': True,
         }
 
 
-def task_process_police_precincts():
-    """
-    Process police precincts data
-    """
-    for dept in Department.list():
-        yield {
-            'name': dept.name,
-            'file_dep': [
-                dept.block_groups_path,
-                dept.preprocessed_shapefile_path,
-            ],
-            'targets': [dept.police_precincts_path],
-            'actions': [dept.process_police_precincts],
-            'clean': True,
-        }
-
-
 # import tasks from output.py
 # leave me at the end of this file
 from output import *
@@ -133,7 +133,7 @@ def task_generate_sc_figure1():
                 dept.guessed_city_path,
                 dept.police_precincts_path,
             ],
-            'task_dep': ['download_place_boundaries'],
+            'task_dep': ['download_boundaries'],
             'targets': [dept.sc_figure1_path],
             'actions': [dept.generate_sc_figure1],
             'clean': True,
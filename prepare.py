@@ -5,6 +5,7 @@ Run this before the main dodo.py file.
 """
 
 from cpe_help import (
+    ACS,
     Department,
     TIGER,
     util,
@@ -40,3 +41,16 @@ def task_create_tiger_directories():
         'actions': [tiger.create_directories],
         'uptodate': [True],
     }
+
+
+def task_create_acs_directories():
+    """
+    Create ACS's directories
+    """
+    acs = ACS()
+    return {
+        'file_dep': [util.path.CONFIG_PATH],
+        'targets': acs.directories,
+        'actions': [acs.create_directories],
+        'uptodate': [True],
+    }